@@ -0,0 +1,198 @@
+"""
+Benchmark del pipeline con datos sintéticos (lib/synthetic.py).
+
+Mide tiempo y memoria de cada etapa (ingestion, aggregation, pairBuilding,
+scoring, export) para 500, 2,000 y 5,000 zonas sin arcpy ni red, y guarda
+los resultados en JSON para comparar entre commits:
+
+    python benchmark.py --zones 500 2000 5000 --out benchmarks
+"""
+import os
+import json
+import time
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+import numpy as np
+import pandas as pd
+from contextlib import contextmanager
+from lib import synthetic
+from lib.odwriter import toSparse, writeSparse
+from lib.trace import peakRss
+
+SIZES = (500, 2000, 5000)
+TARGETS = ['Caminando', 'Transporte_Colectivo', 'Taxi', 'Bicicleta', 'Motocicleta', 'Vehiculo', 'Otros', 'Total']
+SELECTED_VARS = ['sum_POBTOT', 'act_722515', 'act_722514', 'act_812110', 'Unidades_Economicas', 'Paradas_Camion', 'sum_VPH_AUTOM', 'sum_TVIVPARHAB']
+
+
+@contextmanager
+def stage(results, name, traceMemory = False):
+    """
+    Sin traceMemory mide tiempo y peakRss; con traceMemory sólo el pico de
+    memoria de tracemalloc, que infla los tiempos y se mide en otra pasada.
+    """
+    if traceMemory:
+        tracemalloc.start()
+    start, cpu = time.perf_counter(), time.process_time()
+    record = {'stage': name}
+    try:
+        yield record
+    finally:
+        if traceMemory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            record['peakAlloc'] = peak / 1024**2
+        else:
+            record.update({
+                'wall'      : time.perf_counter() - start,
+                'cpu'       : time.process_time() - cpu,
+                'peakRss'   : peakRss(),
+            })
+        results.append(record)
+
+
+def zoneModel(fullData):
+    """Modelo lineal de juguete en lugar de origen.pkl/destino.pkl"""
+    X = fullData[SELECTED_VARS].to_numpy(dtype = np.float64)
+    X = np.column_stack([X, np.ones(len(X))])
+    coefs = {}
+    for target in ['datosAgrupados_Total_origen', 'datosAgrupados_Total_destino']:
+        coefs[target] = np.linalg.lstsq(X, fullData[target].to_numpy(dtype = np.float64), rcond = None)[0]
+    return X, coefs
+
+
+def fluxModel(X, y, seed = 0):
+    """XGBoost pequeño si está instalado; si no, mínimos cuadrados"""
+    try:
+        import xgboost as xgb
+        model = xgb.XGBRegressor(n_estimators = 50, max_depth = 6, tree_method = 'hist', random_state = seed)
+        sample = np.random.default_rng(seed).choice(len(X), min(len(X), 50_000), replace = False)
+        model.fit(X[sample], y[sample])
+        return model
+    except ImportError:
+        class Linear:
+            def __init__(self, X, y):
+                self.coef = np.linalg.lstsq(np.column_stack([X, np.ones(len(X))]), y, rcond = None)[0]
+
+            def predict(self, X):
+                return np.column_stack([X, np.ones(len(X))]) @ self.coef
+        return Linear(X, y)
+
+
+def runPipeline(data, outDir, traceMemory = False):
+    results = []
+
+    with stage(results, 'ingestion', traceMemory) as r:
+        odData = data['od'].copy()
+        odData.dropna(inplace=True)
+        odData.set_index(['Origen', 'Destino'], inplace=True)
+        vehiculo = [x for x in odData.columns if 'Auto' in x or 'Camioneta' in x]
+        odData.insert(5, 'Vehiculo', odData[vehiculo].sum(axis=1))
+        odData.drop(vehiculo, axis = 1, inplace=True)
+        r['rowsIn'] = r['rowsOut'] = len(odData)
+
+    with stage(results, 'aggregation', traceMemory) as r:
+        # Equivalente a SummarizeWithin sobre la malla
+        z = data['zones']
+        side = int(z['col'].max()) + 1
+        x0 = synthetic.CENTER[0] - side * synthetic.CELL / 2
+        y0 = synthetic.CENTER[1] - side * synthetic.CELL / 2
+        def zoneOf(points):
+            col = np.floor((points['lon'].to_numpy() - x0) / synthetic.CELL).astype(np.int64)
+            row = np.floor((points['lat'].to_numpy() - y0) / synthetic.CELL).astype(np.int64)
+            return z['CODIGO_MZ'].to_numpy()[np.clip(row * side + col, 0, len(z) - 1)]
+        denue = data['denue'].assign(Join_ID = zoneOf(data['denue']), Point_Count = 1)
+        acts = denue.pivot_table(values = 'Point_Count', index = 'Join_ID', columns = 'codigo_act', aggfunc='sum', fill_value = 0).add_prefix('act_')
+        paradas = pd.Series(zoneOf(data['gtfs'])).value_counts().rename('Paradas_GTFS')
+        mibici = pd.Series(zoneOf(data['mibici'])).value_counts().rename('Estaciones_MiBici')
+        fullData = data['fullData'].set_index('CODIGO_MZ').join(acts, rsuffix = '_agg').join(paradas).join(mibici).fillna(0)
+        r['rowsIn'] = len(data['denue']) + len(data['gtfs']) + len(data['mibici'])
+        r['rowsOut'] = len(fullData)
+
+    with stage(results, 'pairBuilding', traceMemory) as r:
+        X, coefs = zoneModel(fullData)
+        toJoin = pd.DataFrame({'Viajes Origen': np.int64(np.round(X @ coefs['datosAgrupados_Total_origen'])),
+                               'Viajes Destino': np.int64(np.round(X @ coefs['datosAgrupados_Total_destino']))}, index = fullData.index)
+        joining = fullData.join(toJoin)
+        odcopy = odData.join(joining, on='Origen')
+        odcopy = odcopy.join(joining, on='Destino', rsuffix='__DESTINO', lsuffix='__ORIGEN')
+        codes = z['CODIGO_MZ'].to_numpy()
+        o = pd.Index(codes).get_indexer(odcopy.index.get_level_values('Origen'))
+        d = pd.Index(codes).get_indexer(odcopy.index.get_level_values('Destino'))
+        for mode, skim in data['skims'].items():
+            odcopy[f'travel_time_{mode}'] = skim[o, d]
+        odcopy.fillna(0, inplace=True)
+        r['rowsIn'] = len(odData)
+        r['rowsOut'] = len(odcopy)
+
+    predictors = [x for x in odcopy.columns if x not in TARGETS]
+    model = fluxModel(odcopy[predictors].to_numpy(dtype = np.float32), odcopy[TARGETS].to_numpy(dtype = np.float32))
+
+    with stage(results, 'scoring', traceMemory) as r:
+        y_pred = pd.DataFrame(model.predict(odcopy[predictors].to_numpy(dtype = np.float32)), index=odcopy.index, columns=TARGETS)
+        y_pred[y_pred < 0] = 0
+        y_pred = y_pred.astype(int)
+        r['rowsIn'] = r['rowsOut'] = len(y_pred)
+
+    with stage(results, 'export', traceMemory) as r:
+        sparse = toSparse(y_pred)
+        report = writeSparse(sparse, os.path.join(outDir, 'flux.csv'))
+        r['rowsIn'] = len(y_pred)
+        r['rowsOut'] = report['rows']
+        r['bytes'] = report['bytes']
+
+    return results
+
+
+def gitCommit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output = True, text = True, check = True,
+                              cwd = os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--zones', type = int, nargs = '+', default = list(SIZES))
+    parser.add_argument('--maxPairs', type = int, default = 2_000_000)
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--out', default = 'benchmarks')
+    parser.add_argument('--noAllocations', action = 'store_true', help = 'Omite la pasada con tracemalloc')
+    args = parser.parse_args(argv)
+
+    commit = gitCommit()
+    report = {
+        'commit'    : commit,
+        'date'      : time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python'    : platform.python_version(),
+        'machine'   : platform.machine(),
+        'runs'      : [],
+    }
+    for n in args.zones:
+        print(f'Zones: {n}')
+        data = synthetic.dataset(n, args.seed, args.maxPairs)
+        with tempfile.TemporaryDirectory() as tmp:
+            stages = runPipeline(data, tmp)
+        if not args.noAllocations:
+            with tempfile.TemporaryDirectory() as tmp:
+                allocs = {r['stage']: r['peakAlloc'] for r in runPipeline(data, tmp, traceMemory = True)}
+            for s in stages:
+                s['peakAlloc'] = allocs.get(s['stage'])
+        for s in stages:
+            alloc = f"{s['peakAlloc']:>9.1f}MB" if s.get('peakAlloc') is not None else ''
+            print(f"  {s['stage']:<14}{s['wall']:>9.2f}s {alloc}")
+        report['runs'].append({'zones': n, 'pairs': len(data['od']), 'stages': stages})
+
+    os.makedirs(args.out, exist_ok = True)
+    path = os.path.join(args.out, f'{commit}.json')
+    with open(path, 'w', encoding = 'utf-8') as f:
+        json.dump(report, f, indent = 2)
+    print(f'Saved {path}')
+    return report
+
+
+if __name__ == '__main__':
+    main()
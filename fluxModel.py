@@ -6,7 +6,6 @@ Script documentation
 - Update derived parameter values using arcpy.SetParameter() or
                                         arcpy.SetParameterAsText()
 """
-import time
 import json
 import arcpy
 import pickle
@@ -16,13 +15,70 @@ import numpy as np
 import pandas as pd
 import routingpy as rp
 import geopandas as gpd
-import tensorflow as tf
-from tensorflow.keras import Model
 from lib.utils import arcgis_table_to_df
-from tensorflow.keras.layers import Input, Dense
+from lib.pruning import prunePairs, predictPruned, applyMask
+from lib.odwriter import toSparse, writeSparse, writeArcgisTable
+from lib.skims import SkimStore
+from lib.accessibility import accessibility
+from lib.trace import Tracer
+from lib.pairs import loadModel, zoneFeatures, dropIdColumns
+from lib.pyramid import FlowPyramid
+from lib.centroids import zoneLocations
+from lib.ensemble import loadEnsemble, scoreEnsemble, intervalTable
+from lib.pipeline import Pipeline, fetchSkims, PROFILES
+from lib.surrogate import GravitySurrogate
 
 DEBUG = False
 
+# Modelo de flujo: pickle (la red de Keras original o flux_xgb.pkl de lib/training.py) o una red de model/NN (.h5, evaluada con NumPy)
+FLUX_MODEL = './model/flux.pkl'
+
+# Trazas por etapa en JSON lines y etapas a perfilar con cProfile (ver lib/trace.py)
+TRACE_FILE = None
+PROFILE_STAGES = ()
+
+# Filtrado de pares infactibles antes del modelo de flujo (ver lib/pruning.py)
+PRUNE_PAIRS = False
+PRUNE_LIMITS = None
+
+# Copia opcional de los flujos en formato disperso (.parquet, .csv o tabla de ArcGIS); outTable sigue siendo densa
+SPARSE_OUTPUT = None
+
+# Almacén de skims (lib/skims.py); si ya tiene los perfiles no se consulta ORS
+SKIM_STORE = None
+
+# Indicadores de accesibilidad como predictores (requiere reentrenar flux.pkl)
+ACCESSIBILITY = False
+
+# URL del servicio local de predicción (lib/server.py); None para usar flux.pkl aquí
+SCORING_SERVICE = None
+
+# Pirámide de flujos agregados (lib/pyramid.py): nivel -> columna de fullData
+PYRAMID_DIR = None
+PYRAMID_LEVELS = {'municipality': 'CVE_MUN'}
+
+# Puntos de ruteo vectorizados (lib/centroids.py), opcionalmente ajustados a nodos de red (CSV x, y)
+VECTORIZED_XY = False
+SNAP_NODES = None
+# Distancia máxima de ajuste (m); las zonas más lejos de un nodo conservan su punto interior
+SNAP_MAX_DISTANCE = 500
+XY_CACHE = None
+
+# Ensamble para intervalos de predicción (lib/ensemble.py): rutas a pickles o .h5
+ENSEMBLE_MODELS = None
+ENSEMBLE_OUTPUT = None
+
+# Descarga de skims y mapas de Kepler en segundo plano; False corre todo en secuencia
+OVERLAP = True
+
+# Previsualización rápida con el modelo de gravedad calibrado (lib/surrogate.py); ruta al JSON o None
+PREVIEW = None
+
+
+def saveMap(data, config, path):
+    keplergl.KeplerGl(data=data, config=config).save_to_html(file_name=path)
+
+
 if __name__ == '__main__':
 
     #? OD
@@ -38,12 +94,83 @@ if __name__ == '__main__':
     zonificacion    = arcpy.GetParameter(3)
 
     #? Outputs
-    outTable        = arcpy.GetParameter(4)
+    outTable        = arcpy.GetParameterAsText(4)
     map1Path        = arcpy.GetParameterAsText(5)
     map2Path        = arcpy.GetParameterAsText(6)
 
+    trace = Tracer(TRACE_FILE, debug = DEBUG, profile = PROFILE_STAGES)
+
+    pipeline = Pipeline(enabled = OVERLAP)
+
+    #! Network data
+    trace.begin('Starting Network Data')
+
+    ors = rp.routers.ORS(apiKey)
+
+    # zonificacionXY
+    trace.begin('Creating XY Data', depth = 1)
+
+    if VECTORIZED_XY:
+        arcpy.conversion.FeaturesToJSON(
+            in_features     = zonificacion,
+            out_json_file   = 'in_memory/zonaWGS84.geojson',
+            format_json     = "NOT_FORMATTED",
+            include_z_values= "NO_Z_VALUES",
+            include_m_values= "NO_M_VALUES",
+            geoJSON         = "GEOJSON",
+            outputToWGS84   = "WGS84",
+            use_field_alias = "USE_FIELD_NAME"
+        )
+        nodes = pd.read_csv(SNAP_NODES) if SNAP_NODES else None
+        xy, locations = zoneLocations(gpd.GeoDataFrame.from_file('in_memory/zonaWGS84.geojson'), nodes, XY_CACHE, maxDistance = SNAP_MAX_DISTANCE)
+    else:
+        arcpy.management.FeatureToPoint(
+            in_features         = zonificacion,
+            out_feature_class   = "zonPoint",
+            point_location      = "INSIDE"
+        )
+
+        arcpy.management.CalculateGeometryAttributes(
+            in_features         = "zonPoint",
+            geometry_property   = "PX POINT_X;PY POINT_Y;Annot POINT_COORD_NOTATION",
+            length_unit         = "",
+            area_unit           = "",
+            coordinate_system   = 'GEOGCS["GCS_Mexico_ITRF2008",DATUM["D_Mexico_ITRF2008",SPHEROID["GRS_1980",6378137.0,298.257222101]],PRIMEM["Greenwich",0.0],UNIT["Degree",0.0174532925199433]]',
+            coordinate_format   = "SAME_AS_INPUT"
+        )
+
+        arcpy.conversion.ExportTable(
+            in_table                = "zonPoint",
+            out_table               = "in_memory/zonificacionXY",
+            where_clause            = "",
+            use_field_alias_as_name = "NOT_USE_ALIAS",
+            sort_field              = None
+        )
+
+        xy = arcgis_table_to_df("in_memory/zonificacionXY")
+        xy = xy.set_index('CODIGO_MZ')
+        locations = xy[['PX', 'PY']].values.tolist()
+
+    store = SkimStore(SKIM_STORE) if SkimStore.exists(SKIM_STORE) else None
+    if store is not None and not store.zones.sort_values().equals(pd.Index(xy.index).sort_values()):
+        raise ValueError(f'{SKIM_STORE} tiene {len(store.zones)} zonas de otra zonificación; use otro SKIM_STORE')
+
+    skims = {}
+    if store is not None:
+        trace.begin(f'Reading Skims from {SKIM_STORE}', depth = 1)
+        skims = {p: store.frame(p).reindex(index=xy.index, columns=xy.index) for p in PROFILES if p in store}
+        trace.count('cacheHits', len(skims))
+
+    # Sólo se descargan los perfiles que faltan en el almacén
+    missing = {name: profile for name, profile in PROFILES.items() if name not in skims}
+    skimTask = None
+    if missing:
+        # La descarga sólo depende de los puntos; corre mientras se preparan los datos y los modelos
+        trace.message(f'  Fetching {", ".join(missing)} Data in background')
+        skimTask = pipeline.submit(fetchSkims, ors, locations, xy.index, profiles = missing, name = 'skims')
+
     #! OD Estimación
-    arcpy.AddMessage('Starting OD')
+    span = trace.begin('Starting OD')
 
     odData = arcgis_table_to_df(datosOD)
     odData.dropna(inplace=True)
@@ -52,9 +179,10 @@ if __name__ == '__main__':
     vehiculo = [x for x in odData.columns if 'Auto' in x or 'Camioneta' in x]
     odData.insert(5, 'Vehiculo', odData[vehiculo].sum(axis=1))
     odData.drop(vehiculo, axis = 1, inplace=True)
+    span.rowsOut = len(odData)
 
     #! Generated data
-    arcpy.AddMessage('Starting Generated Data')
+    span = trace.begin('Starting Generated Data')
 
     arcpy.conversion.ExportTable(
         in_table                = fData,
@@ -65,11 +193,11 @@ if __name__ == '__main__':
     )
 
     fullData = arcgis_table_to_df("in_memory/fullDataTable")
-    indexes = [x for x in fullData.columns if 'ID' in x or 'Shape' in x or 'Zonificacion' in x or 'Ubicación' in x]
-    fullData = fullData.drop(indexes, axis = 1)
+    fullData = dropIdColumns(fullData)
+    span.rowsOut = len(fullData)
 
     #! Predict Travels
-    arcpy.AddMessage('Predicting Travels')
+    trace.begin('Predicting Travels')
 
     with open('./model/origen.pkl', 'rb') as f:
         originModel = pickle.load(f)
@@ -78,7 +206,7 @@ if __name__ == '__main__':
         destinationModel = pickle.load(f)
 
     # Prediction data
-    arcpy.AddMessage('  Creating Prediction Data')
+    trace.begin('Creating Prediction Data', depth = 1)
 
     selectedVars = ['sum_POBTOT', 'act_722515', 'act_722514', 'act_812110', 'Unidades_Economicas','Paradas_Camion','sum_VPH_AUTOM', 'sum_TVIVPARHAB']
     selectedData = fullData[['CODIGO_MZ'] + selectedVars].set_index('CODIGO_MZ').fillna(0)
@@ -100,132 +228,107 @@ if __name__ == '__main__':
     odcopy = odcopy.join(joining, on='Origen')
     odcopy = odcopy.join(joining, on='Destino', rsuffix='__DESTINO', lsuffix='__ORIGEN')
 
-    #! Network data
-    arcpy.AddMessage('Starting Network Data')
-
-    ors = rp.routers.ORS(apiKey)
-
-    # zonificacionXY
-    arcpy.AddMessage('  Creating XY Data')
-
-    arcpy.management.FeatureToPoint(
-        in_features         = zonificacion,
-        out_feature_class   = "zonPoint",
-        point_location      = "INSIDE"
-    )
-
-    arcpy.management.CalculateGeometryAttributes(
-        in_features         = "zonPoint",
-        geometry_property   = "PX POINT_X;PY POINT_Y;Annot POINT_COORD_NOTATION",
-        length_unit         = "",
-        area_unit           = "",
-        coordinate_system   = 'GEOGCS["GCS_Mexico_ITRF2008",DATUM["D_Mexico_ITRF2008",SPHEROID["GRS_1980",6378137.0,298.257222101]],PRIMEM["Greenwich",0.0],UNIT["Degree",0.0174532925199433]]',
-        coordinate_format   = "SAME_AS_INPUT"
-    )
-
-    arcpy.conversion.ExportTable(
-        in_table                = "zonPoint",
-        out_table               = "in_memory/zonificacionXY",
-        where_clause            = "",
-        use_field_alias_as_name = "NOT_USE_ALIAS",
-        sort_field              = None
-    )
-
-    xy = arcgis_table_to_df("in_memory/zonificacionXY")
-    xy = xy.set_index('CODIGO_MZ')
-    xy['list'] = xy[['PX', 'PY']].values.tolist()
-
-    arcpy.AddMessage('  Getting Car Data')
-    durationData = pd.DataFrame(columns=xy.index, index=xy.index)
-    for i in range(0,68):
-        dest = [i for i in range(7*i, 7*(i+1))]
-        if i == 40:
-            arcpy.AddMessage('      Sleeping for 60sec to reset API use')
-            time.sleep(60)
-            arcpy.AddMessage('      Continuing')
-        dist = ors.matrix(xy.list.values.tolist(), profile = 'driving-car', sources=dest)
-        durationData.iloc[dest] = np.array(dist.raw['durations'])
-
-    # Se debe correr una vez más para cubrir todos
-    dest = [476, 477]
-    dist = ors.matrix(xy.list.values.tolist(), profile = 'driving-car', sources=dest)
-    durationData.iloc[dest] = np.array(dist.raw['durations'])
-
-    arcpy.AddMessage('  Sleeping for 60sec to reset API use')
-    time.sleep(60)
-    arcpy.AddMessage('  Continuing')
-
-    arcpy.AddMessage('  Getting Walking Data')
-    durationData2 = pd.DataFrame(columns=xy.index, index=xy.index)
-    for i in range(0,68):
-        dest = [i for i in range(7*i, 7*(i+1))]
-        if i == 40: 
-            arcpy.AddMessage('      Sleeping for 60sec to reset API use')
-            time.sleep(60)
-            arcpy.AddMessage('      Continuing')
-        dist = ors.matrix(xy.list.values.tolist(), profile = 'foot-walking', sources=dest)
-        durationData2.iloc[dest] = np.array(dist.raw['durations'])
-
-    # Se debe correr una vez más para cubrir todos
-    dest = [476, 477]
-    dist = ors.matrix(xy.list.values.tolist(), profile = 'foot-walking', sources=dest)
-    durationData2.iloc[dest] = np.array(dist.raw['durations'])
+    trace.begin('Waiting for Network Data')
+    if skimTask is not None:
+        fetched, calls = skimTask.result()
+        trace.count('routerCalls', calls)
+        trace.message(f'  Skims fetched in {skimTask.duration:.0f}s, waited {skimTask.waited:.0f}s')
+        skims.update(fetched)
+        if SKIM_STORE:
+            # Se agregan al almacén existente sin tocar sus otros perfiles
+            if store is None:
+                store = SkimStore.create(SKIM_STORE, xy.index)
+            for profile, seconds in fetched.items():
+                store.add(profile, seconds)
+    durationData = skims['Driving']
+    durationData2 = skims['Walking']
 
     # Joining Data
     dD = durationData.reset_index().melt(id_vars='CODIGO_MZ', var_name='Destino', value_name='travel_time').rename(columns={'CODIGO_MZ': 'Origen'}).set_index(['Origen', 'Destino']).sort_index()
     dD2 = durationData2.reset_index().melt(id_vars='CODIGO_MZ', var_name='Destino', value_name='travel_time').rename(columns={'CODIGO_MZ': 'Origen'}).set_index(['Origen', 'Destino']).sort_index()
     travelData = dD.join(dD2, lsuffix='_Driving', rsuffix='_Walking')
     odcopy = odcopy.join(travelData)
+
+    if ACCESSIBILITY:
+        trace.begin('Computing Accessibility', depth = 1)
+        acc = accessibility(zoneFeatures(fullData), {'Driving': durationData, 'Walking': durationData2})
+        odcopy = odcopy.join(acc.add_suffix('__ORIGEN'), on='Origen')
+        odcopy = odcopy.join(acc.add_suffix('__DESTINO'), on='Destino')
+
+    if PRUNE_PAIRS:
+        pairMask = prunePairs(odcopy, xy, PRUNE_LIMITS)
+        trace.message(f'  Pairs to score: {pairMask.score.sum()} of {len(pairMask)}')
     odcopy.fillna(0, inplace=True)
 
     #! Predicting Travel distribution
-    arcpy.AddMessage('Starting Flux Model')
+    span = trace.begin('Starting Flux Model', rowsIn = len(odcopy))
 
     targets = ['Caminando', 'Transporte_Colectivo', 'Taxi', 'Bicicleta', 'Motocicleta', 'Vehiculo', 'Otros', 'Total']
     categorical = odcopy.select_dtypes(include=['object']).columns
     codes = [x for x in odcopy.columns if 'CODIGO' in x]
     predictors = [x for x in odcopy.columns if x not in targets and x not in categorical and x not in codes]
 
-    if DEBUG:
-        arcpy.AddMessage('  Created Cols')
+    trace.debug('  Created Cols')
 
-    with open('./model/flux.pkl', 'rb') as f:
-        fluxModel = pickle.load(f)
+    fluxModel = None if PREVIEW else loadModel(FLUX_MODEL)
 
     arcpy.management.Delete('in_memory')
 
-    if DEBUG:
-        arcpy.AddMessage('  Opened Model')
-        arcpy.AddMessage([x for x in predictors if 'datosAgrupados' not in x and 'act' not in x and 'sum' not in x])
-
-    y_pred = pd.DataFrame(fluxModel.predict(odcopy[predictors]), index=odcopy.index, columns=odcopy[targets].columns)
+    trace.debug('  Opened Model')
+    trace.debug([x for x in predictors if 'datosAgrupados' not in x and 'act' not in x and 'sum' not in x])
+
+    if PREVIEW:
+        trace.message(f'  Preview with {PREVIEW}')
+        y_pred = GravitySurrogate.load(PREVIEW).flows(joining, {'Driving': durationData, 'Walking': durationData2}, odcopy.index)
+    elif SCORING_SERVICE:
+        from lib.server import ScoringClient
+        trace.message(f'  Scoring with {SCORING_SERVICE}')
+        y_pred = ScoringClient(SCORING_SERVICE).flows(odcopy.index.unique('Origen'), targets).reindex(odcopy.index, fill_value=0)
+    elif PRUNE_PAIRS:
+        y_pred = predictPruned(fluxModel, odcopy, predictors, targets, pairMask)
+    else:
+        y_pred = pd.DataFrame(fluxModel.predict(odcopy[predictors]), index=odcopy.index, columns=odcopy[targets].columns)
+    if PRUNE_PAIRS and (PREVIEW or SCORING_SERVICE):
+        # El sustituto y el servicio evalúan todos los pares; se aplican las mismas reglas
+        y_pred = applyMask(y_pred, pairMask)
     y_pred[y_pred < 0] = 0
     y_pred = y_pred.astype(int)
 
-    if DEBUG:
-        arcpy.AddMessage('  Predicted')
+    span.rowsOut = len(y_pred)
+    trace.debug('  Predicted')
 
-    tmpArray = y_pred.to_records(index = True)
-    arcpy.da.NumPyArrayToTable(tmpArray, 'in_memory/tmpTableCrated')
+    if ENSEMBLE_MODELS:
+        trace.begin('Ensemble Intervals', rowsIn = len(odcopy), depth = 1)
+        bands = scoreEnsemble(loadEnsemble(ENSEMBLE_MODELS), odcopy[predictors], targets)
+        trace.current.count('models', len(ENSEMBLE_MODELS))
+        if ENSEMBLE_OUTPUT:
+            intervals = intervalTable(bands, ['mean', 'p5', 'p95']).round()
+            writeSparse(toSparse(intervals), ENSEMBLE_OUTPUT)
 
-    if DEBUG:
-        arcpy.AddMessage('  ArcGis Table')
+    trace.begin('Exporting Table', rowsIn = len(y_pred), depth = 1)
+    report = writeArcgisTable(y_pred, outTable, index = True)
+    trace.current.rowsOut = report['rows']
+    trace.message(f'  {report["rows"]} pairs written in {report["seconds"]:.1f}s')
 
-    arcpy.conversion.ExportTable(
-        in_table                = 'in_memory/tmpTableCrated',
-        out_table               = outTable,
-        where_clause            = "",
-        use_field_alias_as_name = "NOT_USE_ALIAS",
-        sort_field              = None
-    )
+    # Copia opcional sólo con los pares con flujo
+    sparse = toSparse(y_pred) if SPARSE_OUTPUT or PYRAMID_DIR else None
+    if SPARSE_OUTPUT:
+        report = writeSparse(sparse, SPARSE_OUTPUT)
+        trace.message(f'  {report["path"]}: {report["rows"]} of {len(y_pred)} pairs, {report["bytes"]} bytes in {report["seconds"]:.1f}s')
 
-    arcpy.AddMessage('  Exported Table')
+    trace.message('  Exported Table')
+
+    if PYRAMID_DIR:
+        trace.begin('Building Flow Pyramid', rowsIn = len(sparse), depth = 1)
+        zones = zoneFeatures(fullData)
+        levels = {name: zones[col] for name, col in PYRAMID_LEVELS.items() if col in zones}
+        FlowPyramid.build(sparse, levels).save(PYRAMID_DIR)
 
     #! Visualizations
-    arcpy.AddMessage('Starting Kepler Visualizations')
+    trace.begin('Starting Kepler Visualizations')
 
     # Viajes OD
-    arcpy.AddMessage('  OD Prediction')
+    trace.begin('OD Prediction', depth = 1)
 
     #? Zonas to GPD
     arcpy.conversion.FeaturesToJSON(
@@ -240,8 +343,7 @@ if __name__ == '__main__':
     )
 
     zonas = gpd.GeoDataFrame.from_file('in_memory/zona.geojson')
-    if DEBUG:
-        arcpy.AddMessage(zonas[0:10])
+    trace.debug(zonas[0:10])
     
     toDrop = [x for x in zonas.columns if x not in ['CODIGO_MZ', 'geometry']]
     zonasMod = zonas.drop(toDrop, axis = 1)
@@ -403,11 +505,10 @@ if __name__ == '__main__':
     31.1442867897876],
    'mapStyles': {}}}}
     
-    map_clean1 = keplergl.KeplerGl(data={'Zonas': zonasMod, 'Copy of Zonas': zonasMod}, config = config1)
-    map_clean1.save_to_html(file_name=map1Path)
+    pipeline.submit(saveMap, {'Zonas': zonasMod, 'Copy of Zonas': zonasMod}, config1, map1Path, name = 'map1')
 
     # Flux Distribution
-    arcpy.AddMessage('  Distribution')
+    trace.begin('Distribution', depth = 1)
     fluxData = y_pred.join(xy, 'Origen').join(xy, 'Destino', lsuffix='_Origen', rsuffix='_Destino')
 
     config2 = {'version': 'v1',
@@ -544,9 +645,13 @@ if __name__ == '__main__':
     31.1442867897876],
    'mapStyles': {}}}}
     
-    map_clean2 = keplergl.KeplerGl(data={'Zonas': zonas.drop(toDrop, axis = 1), 'FlujoViajes': fluxData}, config = config2)
-    map_clean2.save_to_html(file_name=map2Path)
+    pipeline.submit(saveMap, {'Zonas': zonas.drop(toDrop, axis = 1), 'FlujoViajes': fluxData}, config2, map2Path, name = 'map2')
 
     #! Closing Process
-    arcpy.AddMessage('Finishing Process')
-    arcpy.management.Delete('in_memory')
\ No newline at end of file
+    trace.begin('Finishing Process')
+    pipeline.join()
+    arcpy.management.Delete('in_memory')
+
+    wall, sequential = pipeline.overlapReport()
+    trace.message(f'Total time {wall:.0f}s (sequential estimate {sequential:.0f}s)')
+    trace.end()
\ No newline at end of file
@@ -0,0 +1,84 @@
+"""
+Indicadores de accesibilidad por zona a partir de los skims.
+
+- Oportunidades acumuladas: oportunidades alcanzables desde cada zona en
+  menos de T minutos, para todos los umbrales y modos a la vez.
+- Gravitacional: suma de oportunidades ponderada por exp(-beta * minutos).
+
+Ambas se calculan como productos matriz-vector por bloques de orígenes.
+"""
+import numpy as np
+import pandas as pd
+
+THRESHOLDS = (15, 30, 45)
+OPPORTUNITIES = ('Unidades_Economicas', 'sum_POBTOT')
+BETA = 0.05
+BLOCK_SIZE = 1024
+
+
+def _minutes(skim, zones):
+    """Acepta DataFrame Origen x Destino o arreglo ya alineado; regresa minutos float32"""
+    if isinstance(skim, pd.DataFrame):
+        skim = skim.reindex(index = zones, columns = zones).apply(pd.to_numeric, errors = 'coerce').to_numpy()
+    return np.asarray(skim, dtype = np.float32) / np.float32(60)
+
+
+def cumulative(minutes, opportunities, thresholds = THRESHOLDS, blockSize = BLOCK_SIZE):
+    """
+    minutes         N x N (NaN = sin ruta)
+    opportunities   N x K
+    regresa         len(thresholds) x N x K
+    """
+    thr = np.asarray(thresholds, dtype = np.float32)[:, None, None]
+    opp = np.asarray(opportunities, dtype = np.float32)
+    n = minutes.shape[0]
+    out = np.empty((len(thresholds), n, opp.shape[1]), dtype = np.float32)
+    for start in range(0, n, blockSize):
+        block = minutes[start:start + blockSize]
+        # NaN <= thr es falso, así que las zonas sin ruta no cuentan
+        reach = (block[None] <= thr).astype(np.float32)
+        out[:, start:start + blockSize] = reach @ opp
+    return out
+
+
+def gravity(minutes, opportunities, beta = BETA, blockSize = BLOCK_SIZE):
+    """Accesibilidad gravitacional con decaimiento exponencial; N x K"""
+    opp = np.asarray(opportunities, dtype = np.float32)
+    n = minutes.shape[0]
+    out = np.empty((n, opp.shape[1]), dtype = np.float32)
+    for start in range(0, n, blockSize):
+        w = np.exp(-np.float32(beta) * minutes[start:start + blockSize])
+        out[start:start + blockSize] = np.nan_to_num(w) @ opp
+    return out
+
+
+def accessibility(features, skims, opportunities = OPPORTUNITIES, thresholds = THRESHOLDS, beta = BETA):
+    """
+    features        DataFrame por zona (índice CODIGO_MZ) con las columnas de oportunidades
+    skims           dict modo -> matriz de segundos (p.ej. {'Driving': durationData, 'Walking': durationData2})
+                    o un SkimStore (se usan todos sus perfiles)
+    Regresa un DataFrame por zona con columnas acc_<modo>_<T>_<oportunidad> y grav_<modo>_<oportunidad>.
+    """
+    if not isinstance(skims, dict):
+        skims = {p: skims.frame(p) for p in skims.profiles}
+    opportunities = [o for o in opportunities if o in features]
+    zones = features.index
+    opp = features[opportunities].apply(pd.to_numeric, errors = 'coerce').fillna(0).to_numpy(dtype = np.float32)
+
+    cols = {}
+    for mode, skim in skims.items():
+        minutes = _minutes(skim, zones)
+        cum = cumulative(minutes, opp, thresholds)
+        for t, thr in enumerate(thresholds):
+            for k, name in enumerate(opportunities):
+                cols[f'acc_{mode}_{thr}_{name}'] = cum[t, :, k]
+        if beta is not None:
+            grav = gravity(minutes, opp, beta)
+            for k, name in enumerate(opportunities):
+                cols[f'grav_{mode}_{name}'] = grav[:, k]
+    return pd.DataFrame(cols, index = zones)
+
+
+def addAccessibility(features, skims, **kwargs):
+    """Agrega los indicadores a la tabla de zonas (p.ej. fullData)"""
+    return features.join(accessibility(features, skims, **kwargs))
@@ -0,0 +1,67 @@
+"""
+Datos sintéticos para el entrenamiento.
+
+Equivale al ciclo de xgboost.ipynb
+
+    for i in range(0, 1000):
+        df.loc[1000 + i] = data.sample(279, random_state = seed + i).median()
+
+pero sortea todos los conjuntos de índices de una vez como una matriz de
+enteros y calcula el estadístico con una sola reducción de NumPy por bloque.
+"""
+import numpy as np
+import pandas as pd
+
+SEED = 4
+CHUNK_SIZE = 4096
+
+STATISTICS = {
+    'median'    : np.median,
+    'mean'      : np.mean,
+}
+
+NAN_STATISTICS = {
+    'median'    : np.nanmedian,
+    'mean'      : np.nanmean,
+}
+
+
+def sampleIndices(nRows, nSamples, sampleSize, replace = False, rng = None):
+    """Matriz nSamples x sampleSize de índices de fila"""
+    rng = rng if rng is not None else np.random.default_rng(SEED)
+    if replace:
+        return rng.integers(0, nRows, size = (nSamples, sampleSize))
+    if sampleSize > nRows:
+        raise ValueError(f'sampleSize ({sampleSize}) mayor que el número de filas ({nRows}) sin reemplazo')
+    # Sin reemplazo: los sampleSize menores de una permutación aleatoria por fila
+    keys = rng.random((nSamples, nRows), dtype = np.float32)
+    return np.argpartition(keys, sampleSize - 1, axis = 1)[:, :sampleSize]
+
+
+def bootstrapRows(data, nSamples = 1000, sampleSize = 279, statistic = 'median', replace = False,
+                  seed = SEED, startIndex = 1000, chunkSize = CHUNK_SIZE):
+    """
+    Genera nSamples filas sintéticas, cada una el estadístico de sampleSize
+    filas sorteadas de data. Con la misma semilla el resultado es idéntico.
+    """
+    values = data.to_numpy(dtype = np.float64)
+    hasNan = np.isnan(values).any()
+    if callable(statistic):
+        func = statistic
+    else:
+        func = (NAN_STATISTICS if hasNan else STATISTICS)[statistic]
+
+    rng = np.random.default_rng(seed)
+    out = np.empty((nSamples, values.shape[1]), dtype = np.float64)
+    for start in range(0, nSamples, chunkSize):
+        n = min(chunkSize, nSamples - start)
+        idx = sampleIndices(len(values), n, sampleSize, replace, rng)
+        out[start:start + n] = func(values[idx], axis = 1)
+
+    index = pd.RangeIndex(startIndex, startIndex + nSamples, name = data.index.name)
+    return pd.DataFrame(out, index = index, columns = data.columns)
+
+
+def augment(data, nSamples = 1000, **kwargs):
+    """data con las filas sintéticas agregadas al final"""
+    return pd.concat([data, bootstrapRows(data, nSamples, **kwargs)])
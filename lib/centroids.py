@@ -0,0 +1,93 @@
+"""
+Puntos interiores de las zonas y ajuste a la red vial.
+
+Sustituye FeatureToPoint(INSIDE) + CalculateGeometryAttributes + ExportTable:
+los puntos interiores se calculan vectorizados con geopandas, se reproyectan a
+WGS84 como un arreglo float64 y, opcionalmente, se ajustan al nodo de red más
+cercano con un KD-tree. El resultado se guarda en caché para reutilizarlo en
+todos los perfiles de ruteo.
+"""
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+
+WGS84 = 'EPSG:4326'
+EARTH_RADIUS = 6371008.8
+
+
+def interiorPoints(zonas, code = 'CODIGO_MZ'):
+    """DataFrame PX/PY (WGS84) por zona a partir de un GeoDataFrame de polígonos"""
+    geoms = zonas.geometry
+    if zonas.crs is not None and not zonas.crs.equals(WGS84):
+        # El punto interior se calcula en el sistema original y luego se reproyecta
+        points = geoms.representative_point().to_crs(WGS84)
+    else:
+        points = geoms.representative_point()
+    xy = np.column_stack([points.x.to_numpy(), points.y.to_numpy()])
+    return pd.DataFrame(xy, index = pd.Index(zonas[code], name = code), columns = ['PX', 'PY'], dtype = np.float64)
+
+
+def _local(lon, lat, lat0):
+    """Proyección equirectangular local en metros (suficiente para vecino más cercano en una ciudad)"""
+    k = np.pi / 180 * EARTH_RADIUS
+    return np.column_stack([lon * k * np.cos(np.radians(lat0)), lat * k])
+
+
+def snapToNetwork(xy, nodes, maxDistance = None):
+    """
+    Ajusta cada punto al nodo de red más cercano.
+    nodes: DataFrame o arreglo con columnas lon/lat (x, y) de los nodos.
+    Los puntos a más de maxDistance metros conservan su posición original.
+    """
+    from scipy.spatial import cKDTree
+
+    nodes = np.asarray(nodes[['x', 'y']] if isinstance(nodes, pd.DataFrame) else nodes, dtype = np.float64)
+    pts = xy[['PX', 'PY']].to_numpy(dtype = np.float64)
+    lat0 = np.nanmean(pts[:, 1])
+    tree = cKDTree(_local(nodes[:, 0], nodes[:, 1], lat0))
+    dist, idx = tree.query(_local(pts[:, 0], pts[:, 1], lat0))
+
+    snapped = nodes[idx].copy()
+    if maxDistance is not None:
+        far = dist > maxDistance
+        snapped[far] = pts[far]
+    out = pd.DataFrame(snapped, index = xy.index, columns = ['PX', 'PY'])
+    out['snapDistance'] = dist
+    return out
+
+
+def geometryHash(zonas, nodes = None, *extra):
+    h = hashlib.sha1()
+    h.update(b''.join(zonas.geometry.to_wkb()))
+    h.update(str(list(zonas.iloc[:, 0])).encode())
+    if nodes is not None:
+        h.update(np.ascontiguousarray(np.asarray(nodes, dtype = np.float64)).tobytes())
+    for value in extra:
+        h.update(repr(value).encode())
+    return h.hexdigest()[:16]
+
+
+def zoneLocations(zonas, nodes = None, cacheDir = None, code = 'CODIGO_MZ', maxDistance = None):
+    """
+    Puntos de ruteo por zona (ajustados a la red si se dan nodos), con caché
+    en cacheDir/<hash>.pkl. Regresa el DataFrame PX/PY y la lista [[lon, lat], ...]
+    que se pasa tal cual a ors.matrix para todos los perfiles.
+    """
+    path = None
+    if cacheDir:
+        nodesArr = None if nodes is None else (nodes[['x', 'y']] if isinstance(nodes, pd.DataFrame) else nodes)
+        # maxDistance cambia el resultado del ajuste, así que forma parte de la llave
+        key = geometryHash(zonas[[code, zonas.geometry.name]], nodesArr, *([maxDistance] if nodesArr is not None else []))
+        path = os.path.join(cacheDir, f'xy_{key}.pkl')
+        if os.path.exists(path):
+            xy = pd.read_pickle(path)
+            return xy, xy[['PX', 'PY']].to_numpy().tolist()
+
+    xy = interiorPoints(zonas, code)
+    if nodes is not None:
+        xy = snapToNetwork(xy, nodes, maxDistance)
+    if path:
+        os.makedirs(cacheDir, exist_ok = True)
+        xy.to_pickle(path)
+    return xy, xy[['PX', 'PY']].to_numpy().tolist()
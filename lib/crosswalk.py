@@ -0,0 +1,129 @@
+"""
+Crosswalk entre sistemas de zonas (zonificación CODIGO_MZ, AGEBs, zonas de
+los municipios, ...).
+
+La superposición entre dos capas de polígonos se calcula una sola vez con el
+índice espacial y se guarda como matriz dispersa M (origen x destino) de
+área o población compartida, en caché por el hash de ambas geometrías. Con
+ella se remapean flujos OD (W^T F W) y variables por zona con productos
+dispersos, sin geoprocesamiento zona por zona.
+"""
+import os
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from lib.centroids import geometryHash
+from lib.pyramid import flowMatrices, aggregate, toFrame
+
+
+def _projected(gdf):
+    """Áreas en metros: reproyecta a UTM si la capa está en grados"""
+    if gdf.crs is not None and gdf.crs.is_geographic:
+        return gdf.to_crs(gdf.estimate_utm_crs())
+    return gdf
+
+
+def overlapMatrix(source, target, sourceCode, targetCode, population = None, popField = 'POBTOT'):
+    """
+    Matriz dispersa S x T de superposición.
+    Sin population se usa el área de la intersección; con population (capa de
+    puntos o polígonos pequeños, p.ej. manzanas) se suma popField de las
+    unidades cuyo punto representativo cae en cada intersección.
+    """
+    import geopandas as gpd
+
+    source = _projected(source)
+    target = _projected(target.to_crs(source.crs) if target.crs != source.crs else target)
+    s, t = target.sindex.query(source.geometry, predicate = 'intersects')
+    if population is None:
+        inter = source.geometry.values[s].intersection(target.geometry.values[t])
+        values = np.asarray(inter.area, dtype = np.float64)
+    else:
+        pts = population.to_crs(source.crs) if population.crs != source.crs else population
+        pts = gpd.GeoDataFrame({popField: pts[popField].to_numpy()}, geometry = pts.geometry.representative_point(), crs = source.crs)
+        si = gpd.sjoin(pts, source[[source.geometry.name]].assign(_s = np.arange(len(source))), predicate = 'within')
+        ti = gpd.sjoin(pts, target[[target.geometry.name]].assign(_t = np.arange(len(target))), predicate = 'within')
+        both = si[['_s', popField]].join(ti[['_t']], how = 'inner')
+        grouped = both.groupby(['_s', '_t'])[popField].sum()
+        s = grouped.index.get_level_values('_s').to_numpy()
+        t = grouped.index.get_level_values('_t').to_numpy()
+        values = grouped.to_numpy(dtype = np.float64)
+    keep = values > 0
+    M = sparse.csr_matrix((values[keep], (s[keep], t[keep])), shape = (len(source), len(target)))
+    return M, pd.Index(source[sourceCode]), pd.Index(target[targetCode])
+
+
+def _normalize(M, axis):
+    totals = np.asarray(M.sum(axis = axis)).ravel()
+    inv = np.divide(1.0, totals, out = np.zeros_like(totals), where = totals > 0)
+    D = sparse.diags(inv)
+    return (D @ M).tocsr() if axis == 1 else (M @ D).tocsr()
+
+
+class Crosswalk:
+    """M (S x T), códigos de cada sistema y las dos normalizaciones"""
+
+    def __init__(self, M, sourceCodes, targetCodes):
+        self.M = M.tocsr()
+        self.sourceCodes = sourceCodes
+        self.targetCodes = targetCodes
+        # Fracción de cada zona origen que cae en cada destino (para conteos)
+        self.W = _normalize(self.M, axis = 1)
+        # Fracción de cada zona destino que viene de cada origen (para tasas / promedios)
+        self.V = _normalize(self.M, axis = 0)
+
+    @classmethod
+    def build(cls, source, target, sourceCode = 'CODIGO_MZ', targetCode = 'CVEGEO', population = None,
+              popField = 'POBTOT', cacheDir = None):
+        path = None
+        if cacheDir:
+            key = geometryHash(source[[sourceCode, source.geometry.name]]) + '_' + geometryHash(target[[targetCode, target.geometry.name]])
+            if population is None:
+                key += '_area'
+            else:
+                # Geometría y valores de la capa de población, y el campo usado
+                key += '_pop' + geometryHash(population[[popField, population.geometry.name]], None, popField)
+            path = os.path.join(cacheDir, f'crosswalk_{key}.npz')
+            if os.path.exists(path):
+                return cls.load(path)
+        cw = cls(*overlapMatrix(source, target, sourceCode, targetCode, population, popField))
+        if path:
+            os.makedirs(cacheDir, exist_ok = True)
+            cw.save(path)
+        return cw
+
+    def save(self, path):
+        M = self.M.tocoo()
+        np.savez_compressed(path, row = M.row, col = M.col, data = M.data, shape = np.array(M.shape),
+                            source = self.sourceCodes.to_numpy(), target = self.targetCodes.to_numpy())
+
+    @classmethod
+    def load(cls, path):
+        f = np.load(path, allow_pickle = True)
+        M = sparse.coo_matrix((f['data'], (f['row'], f['col'])), shape = tuple(f['shape']))
+        return cls(M, pd.Index(f['source']), pd.Index(f['target']))
+
+    def inverse(self):
+        return Crosswalk(self.M.T, self.targetCodes, self.sourceCodes)
+
+    def remapFlows(self, flows, modes = None):
+        """COO (Origen, Destino, modos) del sistema origen al destino: W^T F W"""
+        F = flowMatrices(flows, self.sourceCodes, modes)
+        return toFrame(aggregate(F, self.W), self.targetCodes)
+
+    def remapFeatures(self, features, extensive = None, intensive = None):
+        """
+        Variables por zona (índice = códigos origen) al sistema destino.
+        extensive: conteos que se reparten (población, unidades económicas)
+        intensive: tasas o promedios que se ponderan (porcentajes, densidades)
+        """
+        features = features.reindex(self.sourceCodes)
+        extensive = extensive if extensive is not None else [c for c in features.columns if c not in (intensive or [])]
+        out = {}
+        if extensive:
+            out['extensive'] = pd.DataFrame(self.W.T @ features[extensive].fillna(0).to_numpy(dtype = np.float64),
+                                            index = self.targetCodes, columns = extensive)
+        if intensive:
+            out['intensive'] = pd.DataFrame(self.V.T @ features[intensive].fillna(0).to_numpy(dtype = np.float64),
+                                            index = self.targetCodes, columns = intensive)
+        return pd.concat(out.values(), axis = 1) if out else pd.DataFrame(index = self.targetCodes)
@@ -0,0 +1,286 @@
+"""
+Tabla de entrenamiento del modelo de flujo en Parquet particionado.
+
+Sustituye el to_csv de fluxModelData.ipynb: los pares OD de la encuesta con
+sus variables __ORIGEN/__DESTINO y travel_time_<perfil> (mismo orden de
+columnas que odcopy) se escriben en float32, un archivo por bloque de zonas
+origen. Cada partición guarda en manifest.json el hash de sus entradas (filas
+de la encuesta, variables de las zonas involucradas y tiempos de viaje), así
+que al reconstruir sólo se reescriben las particiones que cambiaron. El
+cargador lee sólo las columnas pedidas y llena directamente el arreglo que
+recibe xgboost (DMatrix o QuantileDMatrix por particiones).
+"""
+import os
+import json
+import glob
+import hashlib
+import argparse
+import numpy as np
+import pandas as pd
+from lib.pairs import TARGETS, PROFILES, numericColumns, travelTimes
+
+BLOCK_SIZE = 64     # zonas origen por partición
+
+
+def _partName(k):
+    return f'part_{k:05d}.parquet'
+
+
+def _hash(*arrays):
+    h = hashlib.sha1()
+    for a in arrays:
+        a = np.asarray(a)
+        if a.dtype == object:
+            h.update(str(a.tolist()).encode())
+        else:
+            h.update(np.ascontiguousarray(a).tobytes())
+    return h.hexdigest()
+
+
+def _zoneRows(values, joining, zones):
+    """Variables por zona (float32); las zonas sin datos quedan en 0 como en odcopy.fillna(0)"""
+    pos = joining.index.get_indexer(zones)
+    rows = values[np.clip(pos, 0, None)]
+    rows[pos < 0] = 0
+    return rows
+
+
+def partitionInputs(odData, joining, skims, targets = TARGETS, profiles = PROFILES, blockSize = BLOCK_SIZE):
+    """
+    Divide la encuesta por bloque de orígenes (posición de la zona en joining)
+    y regresa {k: (pares del bloque, hash de sus entradas)}.
+    """
+    cols = numericColumns(joining)
+    values = joining[cols].to_numpy(dtype = np.float32)
+    origins = odData.index.get_level_values('Origen')
+    pos = joining.index.get_indexer(origins)
+    # Orígenes fuera de la zonificación van a una partición propia al final
+    block = np.where(pos < 0, (len(joining) + blockSize - 1) // blockSize, pos // blockSize)
+
+    header = _hash(np.array(cols + list(targets) + list(profiles), dtype = object))
+    out = {}
+    for k in np.unique(block):
+        rows = odData.iloc[np.flatnonzero(block == k)]
+        o = rows.index.get_level_values('Origen')
+        d = rows.index.get_level_values('Destino')
+        times = [travelTimes(skims, o, d, p) for p in profiles]
+        key = _hash(np.array([header], dtype = object), o.to_numpy(), d.to_numpy(),
+                    rows[targets].to_numpy(dtype = np.float32),
+                    _zoneRows(values, joining, o.unique()), _zoneRows(values, joining, d.unique()), *times)
+        out[int(k)] = (rows, key)
+    return out
+
+
+def partitionTable(rows, joining, skims, targets = TARGETS, profiles = PROFILES, dtype = np.float32):
+    """Tabla Arrow de un bloque: Origen, Destino, variables float32 y objetivos"""
+    import pyarrow as pa
+
+    cols = numericColumns(joining)
+    values = joining[cols].to_numpy(dtype = dtype)
+    o = rows.index.get_level_values('Origen')
+    d = rows.index.get_level_values('Destino')
+    X = np.hstack([_zoneRows(values, joining, o), _zoneRows(values, joining, d)] +
+                  [travelTimes(skims, o, d, p).astype(dtype)[:, None] for p in profiles])
+    # Orden Fortran: cada columna de Parquet sale de un bloque contiguo
+    X = np.asfortranarray(np.nan_to_num(X, copy = False))
+    names = [c + '__ORIGEN' for c in cols] + [c + '__DESTINO' for c in cols] + [f'travel_time_{p}' for p in profiles]
+
+    arrays = {'Origen': pa.array(o.to_numpy()), 'Destino': pa.array(d.to_numpy())}
+    arrays |= {name: pa.array(X[:, j]) for j, name in enumerate(names)}
+    arrays |= {t: pa.array(rows[t].to_numpy(dtype = dtype)) for t in targets}
+    return pa.table(arrays)
+
+
+class TrainingDataset:
+    """
+    Directorio con las particiones y manifest.json:
+        features    columnas predictoras en orden
+        targets     columnas objetivo
+        partitions  {archivo: {hash, rows}}
+    """
+
+    def __init__(self, path):
+        self.path = path
+        manifestPath = os.path.join(path, 'manifest.json')
+        self.meta = {'features': [], 'targets': [], 'partitions': {}}
+        if os.path.exists(manifestPath):
+            with open(manifestPath, 'r', encoding = 'utf-8') as f:
+                self.meta = json.load(f)
+
+    @property
+    def features(self):
+        return self.meta['features']
+
+    @property
+    def targets(self):
+        return self.meta['targets']
+
+    @property
+    def rows(self):
+        return sum(p['rows'] for p in self.meta['partitions'].values())
+
+    def parts(self):
+        return [os.path.join(self.path, name) for name in sorted(self.meta['partitions'])]
+
+    def _writeManifest(self):
+        tmp = os.path.join(self.path, 'manifest.json.tmp')
+        with open(tmp, 'w', encoding = 'utf-8') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, os.path.join(self.path, 'manifest.json'))
+
+    def build(self, odData, joining, skims, targets = TARGETS, profiles = PROFILES, blockSize = BLOCK_SIZE,
+              compression = 'zstd', log = None):
+        """
+        Escribe (o actualiza) las particiones; regresa (reescritas, sin cambio).
+        odData indexado por (Origen, Destino) con las columnas objetivo.
+        """
+        import pyarrow.parquet as pq
+
+        os.makedirs(self.path, exist_ok = True)
+        for tmp in glob.glob(os.path.join(self.path, '*.tmp')):
+            os.remove(tmp)
+        # Cambiar el tamaño de bloque reacomoda todas las particiones
+        if self.meta.get('blockSize') != blockSize:
+            self.meta['partitions'] = {}
+        self.meta['blockSize'] = blockSize
+
+        inputs = partitionInputs(odData, joining, skims, targets, profiles, blockSize)
+        old = self.meta['partitions']
+        new = {}
+        written = 0
+        for k, (rows, key) in inputs.items():
+            name = _partName(k)
+            path = os.path.join(self.path, name)
+            if name in old and old[name]['hash'] == key and os.path.exists(path):
+                new[name] = old[name]
+                continue
+            table = partitionTable(rows, joining, skims, targets, profiles)
+            # Temporal + rename para que una partición a medias no cuente como válida
+            pq.write_table(table, path + '.tmp', compression = compression)
+            os.replace(path + '.tmp', path)
+            new[name] = {'hash': key, 'rows': len(rows)}
+            written += 1
+            if log:
+                log(f'    {name}: {len(rows)} pairs')
+            self.meta['features'] = [c for c in table.column_names if c not in ('Origen', 'Destino') and c not in targets]
+
+        for path in glob.glob(os.path.join(self.path, 'part_*.parquet')):
+            if os.path.basename(path) not in new:
+                os.remove(path)
+        self.meta['targets'] = list(targets)
+        self.meta['partitions'] = new
+        self._writeManifest()
+        return written, len(new) - written
+
+    def _read(self, path, columns):
+        import pyarrow.parquet as pq
+        return pq.read_table(path, columns = columns)
+
+    def _fill(self, table, columns, out):
+        for j, name in enumerate(columns):
+            out[:, j] = table.column(name).to_numpy()
+
+    def arrays(self, features = None, targets = None, dtype = np.float32):
+        """
+        (X, y) float32 leyendo sólo las columnas pedidas; cada partición se
+        copia directo a su rango de filas del arreglo final.
+        """
+        features = list(features or self.features)
+        targets = list(targets or self.targets)
+        X = np.empty((self.rows, len(features)), dtype = dtype)
+        y = np.empty((self.rows, len(targets)), dtype = dtype)
+        start = 0
+        for path in self.parts():
+            table = self._read(path, features + targets)
+            end = start + table.num_rows
+            self._fill(table, features, X[start:end])
+            self._fill(table, targets, y[start:end])
+            start = end
+        return X, y
+
+    def index(self):
+        """MultiIndex (Origen, Destino) en el mismo orden que arrays()"""
+        frames = [self._read(path, ['Origen', 'Destino']).to_pandas() for path in self.parts()]
+        return pd.MultiIndex.from_frame(pd.concat(frames, ignore_index = True))
+
+    def frame(self, features = None, targets = None):
+        """(X, y) como DataFrames sin copiar los arreglos, para XGBRegressor.fit"""
+        X, y = self.arrays(features, targets)
+        return (pd.DataFrame(X, columns = list(features or self.features), copy = False),
+                pd.DataFrame(y, columns = list(targets or self.targets), copy = False))
+
+    def dmatrix(self, features = None, targets = None, quantile = False, maxBin = 256, nThreads = None):
+        """
+        DMatrix con los arreglos de arrays(); con quantile = True construye un
+        QuantileDMatrix recorriendo las particiones una por una, sin juntar la
+        tabla completa en memoria.
+        """
+        import xgboost as xgb
+
+        features = list(features or self.features)
+        targets = list(targets or self.targets)
+        if not quantile:
+            X, y = self.arrays(features, targets)
+            return xgb.DMatrix(X, label = y, feature_names = features, nthread = nThreads or -1)
+
+        dataset = self
+
+        class Partitions(xgb.DataIter):
+            def __init__(self):
+                self._k = 0
+                self._parts = dataset.parts()
+                super().__init__()
+
+            def next(self, input_data):
+                if self._k == len(self._parts):
+                    return 0
+                table = dataset._read(self._parts[self._k], features + targets)
+                X = np.empty((table.num_rows, len(features)), dtype = np.float32)
+                y = np.empty((table.num_rows, len(targets)), dtype = np.float32)
+                dataset._fill(table, features, X)
+                dataset._fill(table, targets, y)
+                input_data(data = X, label = y, feature_names = features)
+                self._k += 1
+                return 1
+
+            def reset(self):
+                self._k = 0
+
+        return xgb.QuantileDMatrix(Partitions(), max_bin = maxBin, nthread = nThreads or -1)
+
+
+def readSurvey(path):
+    """Encuesta OD (Excel) con Auto/Camioneta agrupados en Vehiculo, como fluxModelData.ipynb"""
+    odData = pd.read_excel(path)
+    odData.dropna(inplace=True)
+    odData.set_index(['Origen', 'Destino'], inplace=True)
+    vehiculo = [x for x in odData.columns if 'Auto' in x or 'Camioneta' in x]
+    odData.insert(5, 'Vehiculo', odData[vehiculo].sum(axis=1))
+    odData.drop(vehiculo, axis = 1, inplace=True)
+    return odData
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = 'Tabla de entrenamiento del modelo de flujo en Parquet')
+    parser.add_argument('--od', default = './data/OD2007Estimacion2014.xlsx')
+    parser.add_argument('--fullData', default = './data/fullData.csv')
+    parser.add_argument('--skims', required = True, help = 'SkimStore con los perfiles Driving y Walking')
+    parser.add_argument('--modelDir', default = './model')
+    parser.add_argument('--out', default = './data/fluxModelData')
+    parser.add_argument('--blockSize', type = int, default = BLOCK_SIZE)
+    args = parser.parse_args()
+
+    from lib.pairs import loadModel, readFullData, zoneTable
+    from lib.skims import SkimStore
+    from lib.trace import Tracer
+
+    trace = Tracer()
+    with trace.stage('Zone Table'):
+        joining = zoneTable(readFullData(args.fullData), loadModel('origen.pkl', args.modelDir), loadModel('destino.pkl', args.modelDir))
+    with trace.stage('Partitions') as span:
+        odData = readSurvey(args.od)
+        span.rowsIn = len(odData)
+        written, kept = TrainingDataset(args.out).build(odData, joining, SkimStore(args.skims), blockSize = args.blockSize, log = trace.message)
+        trace.message(f'  {written} partitions written, {kept} unchanged')
+    trace.end()
@@ -0,0 +1,90 @@
+"""
+Predicción por ensamble con intervalos.
+
+La matriz de predictores de los pares OD se construye una sola vez (float32,
+contigua) y los K modelos (variantes bootstrap / cuantílicas de XGBoost, o
+las redes de model/NN) se evalúan en paralelo sobre ese mismo buffer, por
+bloques de filas. Para XGBoost el DMatrix del bloque también se comparte.
+Regresa la media y los percentiles por modo.
+"""
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from lib.pairs import TARGETS, loadModel, modelFeatures
+
+PERCENTILES = (5, 50, 95)
+CHUNK_SIZE = 200_000
+
+
+def loadEnsemble(paths):
+    """Pickles de XGBoost o redes .h5 (lib/nn.py)"""
+    return [loadModel(path) for path in paths]
+
+
+def _booster(model):
+    return model.get_booster() if hasattr(model, 'get_booster') else None
+
+
+def _predict(model, X, dmatrix, nThreads):
+    booster = _booster(model)
+    if booster is not None and dmatrix is not None:
+        booster.set_param({'nthread': nThreads})
+        return booster.predict(dmatrix)
+    return model.predict(X)
+
+
+def scoreEnsemble(models, pairs, targets = TARGETS, percentiles = PERCENTILES, nJobs = None, nThreads = None, chunkSize = CHUNK_SIZE):
+    """
+    pairs   tabla de predictores (se reordena a las columnas del primer modelo)
+    Regresa dict estadístico -> DataFrame (pares x modos): 'mean', 'std' y 'p<q>'.
+    """
+    features = modelFeatures(models[0], pairs)
+    X = np.ascontiguousarray(features.to_numpy(dtype = np.float32))
+    first = _booster(models[0])
+    names = list(features.columns) if first is not None and first.feature_names is not None else None
+    nJobs = nJobs or min(len(models), os.cpu_count() or 1)
+    perModel = max(1, (nThreads or os.cpu_count() or 1) // nJobs)
+    useDMatrix = any(_booster(m) is not None for m in models)
+    if useDMatrix:
+        import xgboost as xgb
+
+    stats = {'mean': [], 'std': []} | {f'p{q}': [] for q in percentiles}
+    with ThreadPoolExecutor(max_workers = nJobs) as pool:
+        for start in range(0, len(X), chunkSize):
+            block = X[start:start + chunkSize]
+            # Un solo DMatrix por bloque, compartido por todos los modelos XGBoost
+            dmatrix = xgb.DMatrix(block, feature_names = names, nthread = nThreads or -1) if useDMatrix else None
+            preds = list(pool.map(lambda m: np.asarray(_predict(m, block, dmatrix, perModel), dtype = np.float32).reshape(len(block), -1), models))
+            stack = np.clip(np.stack(preds), 0, None)
+            stats['mean'].append(stack.mean(axis = 0))
+            stats['std'].append(stack.std(axis = 0))
+            for q, values in zip(percentiles, np.percentile(stack, percentiles, axis = 0)):
+                stats[f'p{q}'].append(values)
+
+    return {k: pd.DataFrame(np.concatenate(v), index = pairs.index, columns = targets) for k, v in stats.items()}
+
+
+def intervalTable(bands, stats = None):
+    """Une los estadísticos en una sola tabla con columnas <modo>_<estadístico>"""
+    stats = stats or list(bands)
+    wide = pd.concat({s: bands[s] for s in stats}, axis = 1)
+    wide.columns = [f'{mode}_{stat}' for stat, mode in wide.columns]
+    return wide
+
+
+def trainBootstrapEnsemble(X, y, k = 10, params = None, seed = 4, nEstimators = 200):
+    """K modelos XGBoost entrenados sobre remuestreos bootstrap de las filas"""
+    import xgboost as xgb
+    from lib.training import BASE_PARAMS
+
+    params = {**{'max_depth': 10, 'colsample_bytree': 0.7}, **(params or {})}
+    rng = np.random.default_rng(seed)
+    models = []
+    for i in range(k):
+        rows = rng.integers(0, len(X), len(X))
+        model = xgb.XGBRegressor(objective = BASE_PARAMS['objective'], tree_method = BASE_PARAMS['tree_method'],
+                                 seed = seed + i, n_estimators = nEstimators, **params)
+        model.fit(X.iloc[rows] if hasattr(X, 'iloc') else X[rows], y.iloc[rows] if hasattr(y, 'iloc') else y[rows])
+        models.append(model)
+    return models
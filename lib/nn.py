@@ -0,0 +1,153 @@
+"""
+Inferencia con NumPy para las redes Keras de model/NN (sin TensorFlow).
+
+Lee la configuración y los pesos del .h5 una sola vez con h5py y evalúa la
+pila Dense/activación como multiplicaciones de matrices float32 por bloques
+de pares OD. compareWithKeras() verifica contra TensorFlow cuando está
+instalado; python -m lib.nn guarda esa comparación para las redes de
+model/NN en model/NN/comparison.json.
+"""
+import os
+import json
+import argparse
+import numpy as np
+
+CHUNK_SIZE = 65_536
+
+ACTIVATIONS = {
+    'linear'    : lambda x: x,
+    'relu'      : lambda x: np.maximum(x, 0),
+    'sigmoid'   : lambda x: 1 / (1 + np.exp(-x)),
+    'tanh'      : np.tanh,
+    'softplus'  : lambda x: np.logaddexp(x, 0),
+    'elu'       : lambda x: np.where(x > 0, x, np.expm1(np.minimum(x, 0))),
+    'selu'      : lambda x: np.float32(1.0507009873554805) * np.where(x > 0, x, np.float32(1.6732632423543772) * np.expm1(np.minimum(x, 0))),
+    'swish'     : lambda x: x / (1 + np.exp(-x)),
+    'softmax'   : lambda x: (lambda e: e / e.sum(axis = 1, keepdims = True))(np.exp(x - x.max(axis = 1, keepdims = True))),
+}
+
+# Capas que no hacen nada al predecir
+PASSTHROUGH = {'InputLayer', 'Dropout', 'Flatten', 'GaussianNoise', 'ActivityRegularization'}
+
+
+def _decode(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+def _activation(name):
+    if isinstance(name, dict):
+        name = name.get('config', {}).get('name', name.get('class_name'))
+    name = (name or 'linear').lower()
+    if name not in ACTIVATIONS:
+        raise ValueError(f'Activación no soportada: {name}')
+    return ACTIVATIONS[name]
+
+
+class DenseNet:
+    """Red secuencial de capas Dense con la interfaz predict() de los modelos en pickle"""
+
+    def __init__(self, layers, dtype = np.float32):
+        self.layers = layers  # lista de (kernel, bias, activación)
+        self.dtype = dtype
+
+    @classmethod
+    def load(cls, path, dtype = np.float32):
+        import h5py
+
+        layers = []
+        with h5py.File(path, 'r') as f:
+            config = json.loads(_decode(f.attrs['model_config']))
+            weights = f['model_weights'] if 'model_weights' in f else f
+            layerConfigs = config['config']['layers'] if isinstance(config['config'], dict) else config['config']
+            for layer in layerConfigs:
+                kind, cfg = layer['class_name'], layer['config']
+                if kind in PASSTHROUGH:
+                    continue
+                if kind == 'Activation':
+                    layers.append((None, None, _activation(cfg['activation'])))
+                    continue
+                if kind != 'Dense':
+                    raise ValueError(f'Capa no soportada: {kind} ({cfg.get("name")})')
+                group = weights[cfg['name']]
+                names = [_decode(n) for n in group.attrs['weight_names']]
+                values = {n.split('/')[-1].split(':')[0]: np.asarray(group[n], dtype = dtype) for n in names}
+                bias = values.get('bias') if cfg.get('use_bias', True) else None
+                layers.append((values['kernel'], bias, _activation(cfg.get('activation'))))
+        return cls(layers, dtype)
+
+    @property
+    def nInputs(self):
+        return next(k.shape[0] for k, _, _ in self.layers if k is not None)
+
+    @property
+    def nOutputs(self):
+        return next(k.shape[1] for k, _, _ in reversed(self.layers) if k is not None)
+
+    def _forward(self, x):
+        for kernel, bias, act in self.layers:
+            if kernel is not None:
+                x = x @ kernel
+                if bias is not None:
+                    x += bias
+            x = act(x)
+        return x
+
+    def predict(self, X, chunkSize = CHUNK_SIZE):
+        X = np.asarray(X, dtype = self.dtype)
+        if X.shape[1] != self.nInputs:
+            raise ValueError(f'La red espera {self.nInputs} variables, se recibieron {X.shape[1]}')
+        out = np.empty((len(X), self.nOutputs), dtype = self.dtype)
+        for start in range(0, len(X), chunkSize):
+            out[start:start + chunkSize] = self._forward(X[start:start + chunkSize])
+        return out
+
+
+def compareWithKeras(path, X, rtol = 1e-4, atol = 1e-3):
+    """
+    Diferencia máxima entre DenseNet y tf.keras para las mismas entradas.
+    También compara ambos contra DenseNet en float64 para separar el redondeo
+    de float32 (igual en los dos) de un error de implementación.
+    """
+    import tensorflow as tf
+
+    X = np.asarray(X, dtype = np.float32)
+    expected = tf.keras.models.load_model(path, compile = False).predict(X, verbose = 0)
+    got = DenseNet.load(path).predict(X)
+    reference = DenseNet.load(path, dtype = np.float64).predict(X)
+    scale = np.maximum(np.abs(expected), 1)
+    return {
+        'maxAbsDiff'    : float(np.max(np.abs(expected - got))),
+        'maxRelDiff'    : float(np.max(np.abs(expected - got) / scale)),
+        'allclose'      : bool(np.allclose(expected, got, rtol = rtol, atol = atol)),
+        'kerasVsFloat64': float(np.max(np.abs(expected - reference))),
+        'numpyVsFloat64': float(np.max(np.abs(got - reference))),
+    }
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = 'Compara DenseNet contra tf.keras para las redes .h5')
+    parser.add_argument('paths', nargs = '*', default = ['./model/NN/model_0.h5', './model/NN/model_0v2.h5'])
+    parser.add_argument('--rows', type = int, default = 10_000)
+    parser.add_argument('--seed', type = int, default = 4)
+    parser.add_argument('--out', default = './model/NN/comparison.json')
+    args = parser.parse_args()
+
+    import tensorflow as tf
+
+    rng = np.random.default_rng(args.seed)
+    report = {'tensorflow': tf.__version__, 'numpy': np.__version__, 'rows': args.rows, 'seed': args.seed, 'models': {}}
+    for path in args.paths:
+        net = DenseNet.load(path)
+        # Entradas centradas y con la magnitud de las variables crudas (conteos, segundos)
+        inputs = {
+            'normal': rng.standard_normal((args.rows, net.nInputs)),
+            'counts': rng.gamma(1.0, 500.0, (args.rows, net.nInputs)),
+        }
+        report['models'][os.path.basename(path)] = {
+            'shape' : [net.nInputs] + [k.shape[1] for k, _, _ in net.layers if k is not None],
+            **{name: compareWithKeras(path, X) for name, X in inputs.items()},
+        }
+    with open(args.out, 'w', encoding = 'utf-8') as f:
+        json.dump(report, f, indent = 2)
+    print(json.dumps(report, indent = 2))
@@ -0,0 +1,147 @@
+"""
+Salida dispersa de flujos OD.
+
+Los flujos se guardan en formato COO: (Origen, Destino, un conteo int32 por
+modo) omitiendo los pares donde todos los modos son cero. Los escritores
+trabajan por bloques para no materializar copias completas de la tabla.
+"""
+import os
+import time
+import numpy as np
+import pandas as pd
+
+CHUNK_SIZE = 250_000
+
+
+def toSparse(y_pred, dtype = np.int32):
+    """Convierte la tabla densa (índice Origen, Destino) a COO sin ceros"""
+    values = np.asarray(y_pred.to_numpy(), dtype = np.float64)
+    values = np.clip(np.nan_to_num(values), 0, None).astype(dtype)
+    keep = values.any(axis = 1)
+    sparse = pd.DataFrame(values[keep], columns = y_pred.columns)
+    for level in reversed(y_pred.index.names):
+        sparse.insert(0, level, y_pred.index.get_level_values(level)[keep])
+    return sparse
+
+
+def iterChunks(sparse, chunkSize = CHUNK_SIZE):
+    # Sin filas se entrega el bloque vacío para que el archivo se escriba con su esquema
+    if len(sparse) == 0:
+        yield sparse
+    for start in range(0, len(sparse), chunkSize):
+        yield sparse.iloc[start:start + chunkSize]
+
+
+def _report(path, rows, start):
+    return {
+        'path'      : path,
+        'rows'      : rows,
+        'bytes'     : os.path.getsize(path) if os.path.exists(path) else None,
+        'seconds'   : time.perf_counter() - start,
+    }
+
+
+def _parquetChunks(chunks, path, compression = 'zstd'):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    rows = 0
+    writer = None
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index = False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema, compression = compression)
+            writer.write_table(table.cast(writer.schema))
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def _csvChunks(chunks, path):
+    rows = 0
+    with open(path, 'w', newline = '', encoding = 'utf-8') as f:
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(f, index = False, header = i == 0)
+            rows += len(chunk)
+    return rows
+
+
+def writeChunks(chunks, path, compression = 'zstd', fmt = None):
+    """
+    Escribe una secuencia de bloques COO a .parquet o .csv sin juntarlos en
+    memoria; fmt ('parquet' o 'csv') se toma de la extensión si no se da.
+    """
+    start = time.perf_counter()
+    fmt = fmt or os.path.splitext(str(path))[1].lstrip('.').lower()
+    if fmt == 'parquet':
+        rows = _parquetChunks(chunks, path, compression)
+    else:
+        rows = _csvChunks(chunks, path)
+    return _report(path, rows, start)
+
+
+def writeParquet(sparse, path, chunkSize = CHUNK_SIZE, compression = 'zstd'):
+    """Escribe el COO a Parquet por grupos de filas (requiere pyarrow)"""
+    start = time.perf_counter()
+    rows = _parquetChunks(iterChunks(sparse, chunkSize), path, compression)
+    return _report(path, rows, start)
+
+
+def writeCsv(sparse, path, chunkSize = CHUNK_SIZE):
+    """Escribe el COO a CSV agregando bloques al archivo"""
+    start = time.perf_counter()
+    rows = _csvChunks(iterChunks(sparse, chunkSize), path)
+    return _report(path, rows, start)
+
+
+def writeArcgisTable(table, outTable, index = False, tmpTable = 'in_memory/tmpTableCrated'):
+    """
+    Escribe la tabla a ArcGIS. NumPyArrayToTable no sobrescribe, así que se
+    pasa por una tabla in_memory y ExportTable, que respeta overwriteOutput y
+    el formato de salida (gdb, dbf, csv, ...).
+    """
+    import arcpy
+
+    start = time.perf_counter()
+    if arcpy.Exists(tmpTable):
+        arcpy.management.Delete(tmpTable)
+    arcpy.da.NumPyArrayToTable(table.to_records(index = index), tmpTable)
+    arcpy.conversion.ExportTable(
+        in_table                = tmpTable,
+        out_table               = str(outTable),
+        where_clause            = "",
+        use_field_alias_as_name = "NOT_USE_ALIAS",
+        sort_field              = None
+    )
+    arcpy.management.Delete(tmpTable)
+    return {'path': str(outTable), 'rows': len(table), 'bytes': None, 'seconds': time.perf_counter() - start}
+
+
+def writeSparse(sparse, path, **kwargs):
+    """Elige el escritor según la extensión del archivo"""
+    ext = os.path.splitext(str(path))[1].lower()
+    if ext == '.parquet':
+        return writeParquet(sparse, path, **kwargs)
+    if ext == '.csv':
+        return writeCsv(sparse, path, **kwargs)
+    return writeArcgisTable(sparse, path)
+
+
+def readSparse(path, columns = None):
+    """Lee un COO escrito con writeParquet o writeCsv"""
+    if str(path).lower().endswith('.parquet'):
+        return pd.read_parquet(path, columns = columns)
+    return pd.read_csv(path, usecols = columns)
+
+
+def toDense(sparse, zones = None, modes = None):
+    """Reconstruye la tabla densa (Origen, Destino) rellenando los ceros"""
+    modes = modes or [c for c in sparse.columns if c not in ('Origen', 'Destino')]
+    dense = sparse.set_index(['Origen', 'Destino'])[modes]
+    if zones is not None:
+        full = pd.MultiIndex.from_product([zones, zones], names = ['Origen', 'Destino'])
+        dense = dense.reindex(full, fill_value = 0)
+    return dense
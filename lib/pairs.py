@@ -0,0 +1,136 @@
+"""
+Construcción de la tabla de pares OD para el modelo de flujo.
+
+Reproduce lo que hace fluxModel.py (predicción de Viajes Origen/Destino por
+zona, unión por origen y destino con sufijos __ORIGEN/__DESTINO y tiempos de
+viaje) pero para un bloque arbitrario de orígenes x destinos, con arreglos
+de NumPy en lugar de joins de pandas.
+"""
+import os
+import pickle
+import numpy as np
+import pandas as pd
+
+SELECTED_VARS = ['sum_POBTOT', 'act_722515', 'act_722514', 'act_812110', 'Unidades_Economicas', 'Paradas_Camion', 'sum_VPH_AUTOM', 'sum_TVIVPARHAB']
+
+TARGETS = ['Caminando', 'Transporte_Colectivo', 'Taxi', 'Bicicleta', 'Motocicleta', 'Vehiculo', 'Otros', 'Total']
+
+PROFILES = ('Driving', 'Walking')
+
+
+def loadModel(path, modelDir = None):
+    """Modelo en pickle (origen.pkl, destino.pkl, flux.pkl) o red .h5 de model/NN"""
+    if modelDir is not None:
+        path = os.path.join(modelDir, path)
+    if str(path).endswith('.h5'):
+        from lib.nn import DenseNet
+        return DenseNet.load(path)
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def dropIdColumns(fullData):
+    """Quita los campos de ArcGIS (ID, Shape, Zonificacion, Ubicación) igual que fluxModel.py"""
+    indexes = [x for x in fullData.columns if 'ID' in x or 'Shape' in x or 'Zonificacion' in x or 'Ubicación' in x]
+    return fullData.drop(indexes, axis = 1)
+
+
+def readFullData(path):
+    """fullData.csv listo para zoneTable"""
+    return dropIdColumns(pd.read_csv(path))
+
+
+def zoneFeatures(fullData):
+    """fullData indexado por CODIGO_MZ"""
+    return fullData.set_index('CODIGO_MZ') if 'CODIGO_MZ' in fullData else fullData
+
+
+def predictionData(fullData):
+    """Variables de los modelos de origen/destino (selectedVars + %VPH_AUTOMOVIL)"""
+    selectedData = zoneFeatures(fullData)[SELECTED_VARS].fillna(0)
+    selectedData['%VPH_AUTOMOVIL'] = selectedData['sum_VPH_AUTOM']/selectedData['sum_TVIVPARHAB']
+    selectedData.drop(columns=['sum_VPH_AUTOM', 'sum_TVIVPARHAB'], inplace=True)
+    selectedData.fillna(0, inplace = True)
+    return selectedData
+
+
+def zoneTable(fullData, originModel, destinationModel):
+    """fullData + Viajes Origen / Viajes Destino predichos (joining en fluxModel.py)"""
+    # Sin los campos de ArcGIS, que no son predictores de flux.pkl
+    fullData = dropIdColumns(fullData)
+    selectedData = predictionData(fullData)
+    joining = zoneFeatures(fullData).copy()
+    joining['Viajes Origen'] = np.int64(np.round(originModel.predict(selectedData), 0))
+    joining['Viajes Destino'] = np.int64(np.round(destinationModel.predict(selectedData), 0))
+    return joining
+
+
+def numericColumns(joining):
+    return [c for c in joining.columns if pd.api.types.is_numeric_dtype(joining[c]) and 'CODIGO' not in c]
+
+
+def travelTimes(skims, o, d, profile):
+    """
+    Tiempo de viaje por par desde un SkimStore o un dict de DataFrames Origen x Destino.
+    Los pares con zonas fuera de los skims quedan en NaN (0 tras fillna, como en odcopy).
+    """
+    o = pd.Index(o)
+    d = pd.Index(d)
+    if hasattr(skims, 'lookup'):
+        known = (skims.zones.get_indexer(o) >= 0) & (skims.zones.get_indexer(d) >= 0)
+        out = np.full(len(o), np.nan, dtype = np.float32)
+        out[known] = skims.lookup(profile, o[known], d[known])
+        return out
+    skim = skims[profile]
+    rows = skim.index.get_indexer(o)
+    cols = skim.columns.get_indexer(d)
+    known = (rows >= 0) & (cols >= 0)
+    out = skim.to_numpy(dtype = np.float32)[np.clip(rows, 0, None), np.clip(cols, 0, None)]
+    out[~known] = np.nan
+    return out
+
+
+def pairFeatures(joining, origins, destinations = None, skims = None, profiles = PROFILES, dtype = np.float32):
+    """
+    Tabla de predictores para origins x destinations (por defecto todas las zonas).
+    Las columnas siguen el orden de odcopy: variables __ORIGEN, variables __DESTINO
+    y travel_time_<perfil>; los faltantes se rellenan con 0.
+    """
+    destinations = joining.index if destinations is None else pd.Index(destinations)
+    origins = pd.Index(origins)
+    cols = numericColumns(joining)
+    values = joining[cols].to_numpy(dtype = dtype)
+    oPos = joining.index.get_indexer(origins)
+    dPos = joining.index.get_indexer(destinations)
+    if (oPos < 0).any() or (dPos < 0).any():
+        raise KeyError(f'Zonas sin datos: {list(origins[oPos < 0][:5]) + list(destinations[dPos < 0][:5])}')
+
+    oIdx = np.repeat(oPos, len(dPos))
+    dIdx = np.tile(dPos, len(oPos))
+    index = pd.MultiIndex.from_arrays([origins.repeat(len(dPos)), np.tile(destinations.to_numpy(), len(oPos))], names = ['Origen', 'Destino'])
+
+    blocks = [values[oIdx], values[dIdx]]
+    names = [c + '__ORIGEN' for c in cols] + [c + '__DESTINO' for c in cols]
+    if skims is not None:
+        for profile in profiles:
+            blocks.append(travelTimes(skims, index.get_level_values('Origen'), index.get_level_values('Destino'), profile).astype(dtype)[:, None])
+            names.append(f'travel_time_{profile}')
+    X = np.nan_to_num(np.hstack(blocks), copy = False)
+    return pd.DataFrame(X, index = index, columns = names)
+
+
+def modelFeatures(model, pairs):
+    """Columnas en el orden con el que se entrenó el modelo (si lo guarda)"""
+    names = getattr(model, 'feature_names_in_', None)
+    if names is None and hasattr(model, 'get_booster'):
+        names = model.get_booster().feature_names
+    if names is None:
+        return pairs
+    return pairs.reindex(columns = list(names), fill_value = 0)
+
+
+def predictFlows(model, pairs, targets = TARGETS):
+    """Predicción del modelo de flujo con el mismo postproceso de fluxModel.py"""
+    y_pred = pd.DataFrame(model.predict(modelFeatures(model, pairs)), index = pairs.index, columns = targets)
+    y_pred[y_pred < 0] = 0
+    return y_pred.astype(int)
@@ -0,0 +1,104 @@
+"""
+Tareas en segundo plano para traslapar etapas de fluxModel.py.
+
+La descarga de skims de ORS sólo depende de los puntos de las zonas, así que
+arranca en un hilo mientras se cargan los datos y corren los modelos de
+origen/destino; los mapas de Kepler se escriben en segundo plano después de
+la predicción. Cada corrida crea su propio Pipeline, que registra cuánto
+tardó cada tarea y cuánto esperó el hilo principal para estimar el tiempo de
+la versión secuencial (ArcGIS Pro mantiene el módulo cargado entre corridas).
+"""
+import time
+import threading
+import numpy as np
+import pandas as pd
+
+PROFILES = {'Driving': 'driving-car', 'Walking': 'foot-walking'}
+BATCH = 7           # orígenes por petición de matriz
+PER_MINUTE = 40     # peticiones por minuto permitidas por la API
+
+
+class Background:
+    """Corre fn(*args) en un hilo; con enabled = False corre en línea (línea base secuencial)"""
+
+    def __init__(self, fn, *args, name = None, enabled = True, **kwargs):
+        self.name = name or fn.__name__
+        self.value = None
+        self.error = None
+        self.duration = 0.0
+        self.waited = 0.0
+        self._thread = None
+        self.threaded = enabled
+        if enabled:
+            self._thread = threading.Thread(target = self._run, args = (fn, args, kwargs), name = self.name, daemon = True)
+            self._thread.start()
+        else:
+            self._run(fn, args, kwargs)
+
+    def _run(self, fn, args, kwargs):
+        start = time.perf_counter()
+        try:
+            self.value = fn(*args, **kwargs)
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.duration = time.perf_counter() - start
+
+    def result(self):
+        if self._thread is not None:
+            start = time.perf_counter()
+            self._thread.join()
+            self.waited += time.perf_counter() - start
+            self._thread = None
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class Pipeline:
+    """Tareas en segundo plano de una sola corrida"""
+
+    def __init__(self, enabled = True):
+        self.enabled = enabled
+        self.tasks = []
+        self.start = time.perf_counter()
+
+    def submit(self, fn, *args, name = None, **kwargs):
+        task = Background(fn, *args, name = name, enabled = self.enabled, **kwargs)
+        self.tasks.append(task)
+        return task
+
+    def join(self):
+        for task in self.tasks:
+            task.result()
+
+    def overlapReport(self):
+        """(segundos reales, segundos estimados en secuencia)"""
+        wall = time.perf_counter() - self.start
+        # Las tareas en línea ya están dentro de wall; sólo se suma lo que corrió traslapado
+        sequential = wall + sum(t.duration - t.waited for t in self.tasks if t.threaded)
+        return wall, sequential
+
+
+def fetchSkims(ors, locations, zones, profiles = PROFILES, batch = BATCH, perMinute = PER_MINUTE, log = None, sleep = time.sleep):
+    """
+    Matrices de duración (s) Origen x Destino por perfil, pidiendo a ORS
+    bloques de `batch` orígenes y pausando 60 s cada `perMinute` peticiones.
+    Regresa (dict perfil -> DataFrame, número de peticiones).
+    """
+    n = len(locations)
+    out = {}
+    calls = 0
+    for name, profile in profiles.items():
+        durations = np.full((n, n), np.nan)
+        for start in range(0, n, batch):
+            if calls and calls % perMinute == 0:
+                if log:
+                    log('      Sleeping for 60sec to reset API use')
+                sleep(60)
+            sources = list(range(start, min(n, start + batch)))
+            dist = ors.matrix(locations, profile = profile, sources = sources)
+            calls += 1
+            durations[sources] = np.array(dist.raw['durations'], dtype = np.float64)
+        out[name] = pd.DataFrame(durations, index = zones, columns = zones)
+    return out, calls
@@ -0,0 +1,113 @@
+"""
+Filtrado de pares OD antes del modelo de flujo.
+
+Los pares claramente infactibles (sin ruta, demasiado lejos en auto) o
+trivialmente cero (zona sin viajes generados/atraídos) no pasan por
+fluxModel.predict y reciben un valor por regla. La caminata se apaga fuera
+de un rango de tiempo y distancia: por encima del máximo no es factible y por
+debajo del mínimo la encuesta no la mide bien (ver pendientes.txt). El flujo
+de caminata que se quita también se resta de Total.
+"""
+import numpy as np
+import pandas as pd
+
+# Límites por defecto (segundos / metros)
+LIMITS = {
+    'maxDriving'        : 2 * 3600,
+    'maxWalking'        : 60 * 60,
+    'minWalking'        : None,
+    'maxWalkDistance'   : 5000,
+    'minWalkDistance'   : None,
+    'dropMissing'       : True,
+    'dropZeroZones'     : True,
+}
+
+EARTH_RADIUS = 6371008.8
+
+
+def haversine(lon1, lat1, lon2, lat2):
+    """Distancia en línea recta (m) entre arreglos de coordenadas en grados"""
+    lon1, lat1, lon2, lat2 = map(np.radians, (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+
+def pairDistance(index, xy):
+    """Distancia en línea recta por par (Origen, Destino) usando las columnas PX/PY de xy"""
+    px = xy['PX'].to_numpy(dtype = np.float64)
+    py = xy['PY'].to_numpy(dtype = np.float64)
+    o = xy.index.get_indexer(index.get_level_values('Origen'))
+    d = xy.index.get_indexer(index.get_level_values('Destino'))
+    dist = haversine(px[o], py[o], px[d], py[d])
+    dist[(o < 0) | (d < 0)] = np.nan
+    return pd.Series(dist, index = index, name = 'distance')
+
+
+def prunePairs(pairs, xy = None, limits = None):
+    """
+    Regresa un DataFrame con dos máscaras booleanas por par:
+        score   el par se evalúa con el modelo de flujo
+        walk    la caminata es factible para el par
+    Debe llamarse antes de fillna(0) para distinguir los skims faltantes.
+    """
+    lim = dict(LIMITS)
+    if limits:
+        lim.update(limits)
+
+    drive = pd.to_numeric(pairs['travel_time_Driving'], errors = 'coerce').to_numpy(dtype = np.float64)
+    walk = pd.to_numeric(pairs['travel_time_Walking'], errors = 'coerce').to_numpy(dtype = np.float64)
+
+    score = np.ones(len(pairs), dtype = bool)
+    if lim['dropMissing']:
+        score &= ~(np.isnan(drive) & np.isnan(walk))
+    if lim['maxDriving'] is not None:
+        score &= ~(drive > lim['maxDriving'])
+
+    if lim['dropZeroZones'] and 'Viajes Origen__ORIGEN' in pairs and 'Viajes Destino__DESTINO' in pairs:
+        score &= pairs['Viajes Origen__ORIGEN'].fillna(0).to_numpy() > 0
+        score &= pairs['Viajes Destino__DESTINO'].fillna(0).to_numpy() > 0
+
+    walkable = score & ~np.isnan(walk)
+    if lim['maxWalking'] is not None:
+        walkable &= ~(walk > lim['maxWalking'])
+    if lim['minWalking'] is not None:
+        walkable &= ~(walk < lim['minWalking'])
+    if xy is not None and (lim['maxWalkDistance'] is not None or lim['minWalkDistance'] is not None):
+        dist = pairDistance(pairs.index, xy).to_numpy()
+        if lim['maxWalkDistance'] is not None:
+            walkable &= ~(dist > lim['maxWalkDistance'])
+        if lim['minWalkDistance'] is not None:
+            walkable &= ~(dist < lim['minWalkDistance'])
+
+    return pd.DataFrame({'score': score, 'walk': walkable}, index = pairs.index)
+
+
+def applyMask(y, mask, walkCol = 'Caminando', totalCol = 'Total'):
+    """
+    Aplica las reglas de prunePairs a flujos ya calculados (sustituto o
+    servicio): 0 donde mask['score'] es falso; la caminata se pone en 0 donde
+    mask['walk'] es falso y lo que se quita se descuenta de Total para que
+    siga igual a la suma de los modos.
+    """
+    mask = mask.reindex(y.index, fill_value = False)
+    y = y.astype(np.float64)
+    y.loc[~mask['score'].to_numpy()] = 0
+    if walkCol in y:
+        noWalk = ~mask['walk'].to_numpy()
+        removed = np.clip(y[walkCol].to_numpy(), 0, None) * noWalk
+        y.loc[noWalk, walkCol] = 0
+        if totalCol in y:
+            y[totalCol] = y[totalCol].to_numpy() - removed
+    return y
+
+
+def predictPruned(model, pairs, predictors, targets, mask, walkCol = 'Caminando', totalCol = 'Total'):
+    """
+    Evalúa el modelo sólo en los pares con mask['score'] y asigna 0 al resto;
+    la caminata se ajusta como en applyMask.
+    """
+    y = np.zeros((len(pairs), len(targets)), dtype = np.float64)
+    keep = mask['score'].to_numpy()
+    if keep.any():
+        y[keep] = np.asarray(model.predict(pairs.loc[keep, predictors])).reshape(keep.sum(), -1)
+    return applyMask(pd.DataFrame(y, index = pairs.index, columns = targets), mask, walkCol, totalCol)
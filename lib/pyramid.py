@@ -0,0 +1,117 @@
+"""
+Agregación jerárquica de flujos OD (zona -> distrito -> municipio ...).
+
+Cada nivel se define con una matriz dispersa de pertenencia A (zonas x
+grupos) y los flujos agregados por modo son A^T F A. La pirámide calcula
+todos los niveles una vez, los guarda en disco y responde consultas sobre
+niveles gruesos sin volver a hacer groupby sobre la tabla N^2.
+"""
+import os
+import json
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+ZONE = 'zone'
+
+
+def membership(groups, weights = None):
+    """
+    Matriz N x G de pertenencia a partir de una Serie zona -> grupo.
+    weights permite pertenencias parciales (p.ej. de un crosswalk).
+    """
+    codes, labels = pd.factorize(groups, sort = True)
+    data = np.ones(len(groups), dtype = np.float64) if weights is None else np.asarray(weights, dtype = np.float64)
+    valid = codes >= 0
+    A = sparse.csr_matrix((data[valid], (np.arange(len(groups))[valid], codes[valid])), shape = (len(groups), len(labels)))
+    return A, pd.Index(labels)
+
+
+def flowMatrices(flows, zones, modes = None):
+    """dict modo -> matriz N x N dispersa a partir de un COO (Origen, Destino, modos)"""
+    flows = flows.reset_index() if 'Origen' not in flows else flows
+    modes = modes or [c for c in flows.columns if c not in ('Origen', 'Destino')]
+    o = zones.get_indexer(flows['Origen'])
+    d = zones.get_indexer(flows['Destino'])
+    keep = (o >= 0) & (d >= 0)
+    n = len(zones)
+    return {m: sparse.csr_matrix((flows[m].to_numpy(dtype = np.float64)[keep], (o[keep], d[keep])), shape = (n, n)) for m in modes}
+
+
+def aggregate(matrices, A):
+    """A^T F A para cada modo"""
+    At = A.T.tocsr()
+    return {m: (At @ F @ A).tocoo() for m, F in matrices.items()}
+
+
+def toFrame(matrices, labels):
+    """Matrices agregadas a COO (Origen, Destino, modos) sin ceros"""
+    modes = list(matrices)
+    first = matrices[modes[0]].tocsr()
+    # Unión de patrones de todos los modos
+    pattern = sum((abs(matrices[m]).tocsr() for m in modes[1:]), abs(first)).tocoo()
+    rows, cols = pattern.row, pattern.col
+    out = pd.DataFrame({'Origen': labels[rows], 'Destino': labels[cols]})
+    for m in modes:
+        out[m] = np.asarray(matrices[m].tocsr()[rows, cols]).ravel()
+    return out.sort_values(['Origen', 'Destino'], ignore_index = True)
+
+
+class FlowPyramid:
+    """Flujos por nivel; levels es dict nombre -> Serie zona -> grupo, de fino a grueso"""
+
+    def __init__(self, frames, modes):
+        self.frames = frames
+        self.modes = modes
+
+    @classmethod
+    def build(cls, flows, levels, modes = None):
+        flows = flows.reset_index() if 'Origen' not in flows else flows
+        modes = modes or [c for c in flows.columns if c not in ('Origen', 'Destino')]
+        zones = pd.Index(sorted(set(flows['Origen']) | set(flows['Destino'])))
+        for groups in levels.values():
+            zones = zones.union(groups.index)
+        F = flowMatrices(flows, zones, modes)
+
+        frames = {ZONE: flows[['Origen', 'Destino'] + modes].reset_index(drop = True)}
+        for name, groups in levels.items():
+            A, labels = membership(groups.reindex(zones))
+            frames[name] = toFrame(aggregate(F, A), labels)
+        return cls(frames, modes)
+
+    @property
+    def levels(self):
+        return list(self.frames)
+
+    def query(self, level, origins = None, destinations = None, modes = None):
+        df = self.frames[level]
+        if origins is not None:
+            df = df[df['Origen'].isin(origins)]
+        if destinations is not None:
+            df = df[df['Destino'].isin(destinations)]
+        return df.set_index(['Origen', 'Destino'])[modes or self.modes]
+
+    def lines(self, level, xy, groups = None):
+        """
+        Tabla para la capa de líneas de Kepler (PX/PY _Origen y _Destino).
+        xy son los puntos por zona; para niveles agregados se promedian por grupo.
+        """
+        points = xy[['PX', 'PY']]
+        if level != ZONE:
+            points = points.groupby(groups.reindex(points.index)).mean()
+        return self.query(level).join(points, 'Origen').join(points, 'Destino', lsuffix='_Origen', rsuffix='_Destino')
+
+    def save(self, path):
+        os.makedirs(path, exist_ok = True)
+        for level, df in self.frames.items():
+            df.to_pickle(os.path.join(path, f'{level}.pkl'))
+        with open(os.path.join(path, 'pyramid.json'), 'w', encoding = 'utf-8') as f:
+            json.dump({'levels': self.levels, 'modes': self.modes}, f)
+
+    @classmethod
+    def load(cls, path, levels = None):
+        """Carga sólo los niveles pedidos (todos por defecto)"""
+        with open(os.path.join(path, 'pyramid.json'), 'r', encoding = 'utf-8') as f:
+            meta = json.load(f)
+        frames = {level: pd.read_pickle(os.path.join(path, f'{level}.pkl')) for level in (levels or meta['levels'])}
+        return cls(frames, meta['modes'])
@@ -0,0 +1,251 @@
+"""
+Servicio local de predicción con modelos y skims en memoria.
+
+Mantiene cargados origen.pkl, destino.pkl y flux.pkl, las variables por zona
+y los tiempos de viaje, y responde por HTTP en localhost (o un socket Unix):
+
+    GET  /health
+    POST /flows     {"origins": [A, B], "modes": ["Total"], "destinations": null}
+    POST /rescore   {"features": {"A": {"sum_POBTOT": 1200}}, "origins": [A], "modes": [...]}
+
+Las respuestas se guardan en una caché LRU. Para levantarlo:
+
+    python -m lib.server --fullData ./data/fullData.csv --skims ./data/skims.bin --port 8765
+"""
+import os
+import json
+import socket
+import argparse
+import threading
+import http.client
+import socketserver
+import urllib.error
+import urllib.request
+import pandas as pd
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from lib.pairs import TARGETS, loadModel, dropIdColumns, readFullData, zoneTable, pairFeatures, predictFlows
+from lib.skims import SkimStore
+
+HOST = '127.0.0.1'
+PORT = 8765
+CACHE_SIZE = 256
+
+
+class LRUCache:
+    def __init__(self, size = CACHE_SIZE):
+        self.size = size
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.data:
+                self.data.move_to_end(key)
+                self.hits += 1
+                return self.data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.size:
+                self.data.popitem(last = False)
+
+
+class ScoringService:
+    """Modelos, variables por zona y skims residentes"""
+
+    def __init__(self, fullData, skims, modelDir = './model', cacheSize = CACHE_SIZE):
+        self.originModel = loadModel('origen.pkl', modelDir)
+        self.destinationModel = loadModel('destino.pkl', modelDir)
+        self.fluxModel = loadModel('flux.pkl', modelDir)
+        self.fullData = dropIdColumns(fullData)
+        self.skims = skims
+        self.joining = zoneTable(fullData, self.originModel, self.destinationModel)
+        self.cache = LRUCache(cacheSize)
+
+    def _code(self, zone):
+        """Los códigos llegan como texto en JSON; se convierten al tipo del índice"""
+        return pd.Index([zone]).astype(self.joining.index.dtype)[0]
+
+    def flows(self, origins, modes = None, destinations = None, joining = None):
+        origins = [self._code(z) for z in origins]
+        destinations = None if destinations is None else [self._code(z) for z in destinations]
+        pairs = pairFeatures(joining if joining is not None else self.joining, origins, destinations, self.skims)
+        y_pred = predictFlows(self.fluxModel, pairs)
+        return y_pred[modes or TARGETS]
+
+    def rescore(self, features, origins = None, modes = None, destinations = None):
+        """Vuelve a predecir con variables de zona modificadas (sin guardarlas)"""
+        fullData = self.fullData.copy()
+        indexed = 'CODIGO_MZ' in fullData
+        if indexed:
+            fullData = fullData.set_index('CODIGO_MZ')
+        for zone, values in features.items():
+            for col, value in values.items():
+                fullData.loc[self._code(zone), col] = value
+        if indexed:
+            fullData = fullData.reset_index()
+        joining = zoneTable(fullData, self.originModel, self.destinationModel)
+        origins = origins or list(features)
+        return self.flows(origins, modes, destinations, joining), joining.loc[[self._code(z) for z in features], ['Viajes Origen', 'Viajes Destino']]
+
+    def handle(self, path, query):
+        key = (path, json.dumps(query, sort_keys = True, default = str))
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        if path == '/flows':
+            flows = self.flows(query['origins'], query.get('modes'), query.get('destinations'))
+            response = {'flows': toRecords(flows)}
+        elif path == '/rescore':
+            flows, zones = self.rescore(query['features'], query.get('origins'), query.get('modes'), query.get('destinations'))
+            response = {'flows': toRecords(flows), 'zones': toRecords(zones)}
+        else:
+            raise KeyError(path)
+        self.cache.put(key, response)
+        return response
+
+
+def toRecords(df):
+    return json.loads(df.reset_index().to_json(orient = 'records'))
+
+
+def makeHandler(service):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def address_string(self):
+            return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+        def _send(self, status, payload):
+            body = json.dumps(payload, default = str).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self._send(200, {'status': 'ok', 'zones': len(service.joining),
+                                 'cacheHits': service.cache.hits, 'cacheMisses': service.cache.misses})
+            else:
+                self._send(404, {'error': self.path})
+
+        def do_POST(self):
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                query = json.loads(self.rfile.read(length) or b'{}')
+                self._send(200, service.handle(self.path, query))
+            except KeyError as e:
+                self._send(404 if self.path not in ('/flows', '/rescore') else 400, {'error': f'Falta {e}'})
+            except Exception as e:
+                self._send(500, {'error': repr(e)})
+
+    return Handler
+
+
+# Windows (ArcGIS Pro) no tiene AF_UNIX; ahí sólo se sirve por TCP
+if hasattr(socket, 'AF_UNIX'):
+
+    class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    class UnixHTTPConnection(http.client.HTTPConnection):
+        def __init__(self, socketPath, timeout = 60):
+            super().__init__('localhost', timeout = timeout)
+            self.socketPath = socketPath
+
+        def connect(self):
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(self.timeout)
+            self.sock.connect(self.socketPath)
+
+
+def _unixSupported():
+    if not hasattr(socket, 'AF_UNIX'):
+        raise ValueError('Los sockets Unix no están disponibles en esta plataforma; use host y puerto')
+
+
+def serve(service, host = HOST, port = PORT, socketPath = None):
+    handler = makeHandler(service)
+    if socketPath:
+        _unixSupported()
+        if os.path.exists(socketPath):
+            os.remove(socketPath)
+        server = UnixHTTPServer(socketPath, handler)
+    else:
+        server = ThreadingHTTPServer((host, port), handler)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+class ScoringClient:
+    """Cliente para la herramienta de ArcGIS: ScoringClient('http://127.0.0.1:8765') o ScoringClient(socketPath = ...)"""
+
+    def __init__(self, url = f'http://{HOST}:{PORT}', socketPath = None, timeout = 60):
+        self.url = url.rstrip('/')
+        self.socketPath = socketPath
+        self.timeout = timeout
+
+    def _request(self, method, path, payload = None):
+        body = None if payload is None else json.dumps(payload, default = str).encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        if self.socketPath:
+            _unixSupported()
+            conn = UnixHTTPConnection(self.socketPath, self.timeout)
+            try:
+                conn.request(method, path, body = body, headers = headers)
+                response = conn.getresponse()
+                data = json.loads(response.read())
+                if response.status != 200:
+                    raise RuntimeError(data.get('error'))
+                return data
+            finally:
+                conn.close()
+        request = urllib.request.Request(self.url + path, data = body, headers = headers, method = method)
+        try:
+            with urllib.request.urlopen(request, timeout = self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            # Mismo error que por socket: el mensaje del servidor viene en el cuerpo JSON
+            try:
+                message = json.loads(e.read()).get('error')
+            except ValueError:
+                message = None
+            raise RuntimeError(message or f'HTTP {e.code}') from e
+
+    def health(self):
+        return self._request('GET', '/health')
+
+    def flows(self, origins, modes = None, destinations = None):
+        data = self._request('POST', '/flows', {'origins': list(origins), 'modes': modes, 'destinations': destinations})
+        return pd.DataFrame(data['flows']).set_index(['Origen', 'Destino'])
+
+    def rescore(self, features, origins = None, modes = None):
+        data = self._request('POST', '/rescore', {'features': features, 'origins': origins, 'modes': modes})
+        return pd.DataFrame(data['flows']).set_index(['Origen', 'Destino']), pd.DataFrame(data['zones'])
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = 'Servicio local de predicción de flujos OD')
+    parser.add_argument('--fullData', required = True)
+    parser.add_argument('--skims', required = True, help = 'SkimStore con los perfiles Driving y Walking')
+    parser.add_argument('--modelDir', default = './model')
+    parser.add_argument('--host', default = HOST)
+    parser.add_argument('--port', type = int, default = PORT)
+    parser.add_argument('--socket', default = None)
+    args = parser.parse_args()
+
+    service = ScoringService(readFullData(args.fullData), SkimStore(args.skims), args.modelDir)
+    print(f'Serving {len(service.joining)} zones on {args.socket or f"{args.host}:{args.port}"}')
+    serve(service, args.host, args.port, args.socket)
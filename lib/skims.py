@@ -0,0 +1,129 @@
+"""
+Almacén compacto de skims (matrices de tiempo de viaje).
+
+Cada perfil (Driving, Walking, Transit, ...) se guarda como una matriz
+N x N uint16 de segundos cuantizados dentro de un solo archivo binario; los
+metadatos (zonas, perfiles, escala y desplazamientos) van en un JSON al lado.
+Los perfiles se abren de forma perezosa con np.memmap.
+"""
+import os
+import json
+import numpy as np
+import pandas as pd
+
+MISSING = np.iinfo(np.uint16).max
+MAX_VALUE = MISSING - 1
+
+
+def quantize(seconds, scale = 1.0):
+    """
+    Segundos (float, NaN = sin ruta) a uint16 con MISSING como centinela.
+    Los valores mayores a MAX_VALUE * scale (18.2 h con scale = 1) se saturan
+    en ese máximo; para perfiles más largos use una escala mayor.
+    """
+    seconds = np.asarray(seconds, dtype = np.float64)
+    q = np.rint(seconds / scale)
+    missing = np.isnan(q)
+    q = np.clip(np.where(missing, 0, q), 0, MAX_VALUE).astype(np.uint16)
+    q[missing] = MISSING
+    return q
+
+
+def dequantize(values, scale = 1.0, dtype = np.float32):
+    out = values.astype(dtype) * dtype(scale)
+    out[values == MISSING] = np.nan
+    return out
+
+
+class SkimStore:
+    """Conjunto de perfiles de tiempo de viaje sobre un mismo sistema de zonas"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        with open(self.path + '.json', 'r', encoding = 'utf-8') as f:
+            self.meta = json.load(f)
+        self.zones = pd.Index(self.meta['zones'], name = 'CODIGO_MZ')
+        self._matrices = {}
+
+    @classmethod
+    def create(cls, path, zones, scale = 1.0):
+        """Crea un almacén vacío para las zonas dadas (sobrescribe si existe)"""
+        path = str(path)
+        zones = [z.item() if hasattr(z, 'item') else z for z in zones]
+        open(path, 'wb').close()
+        with open(path + '.json', 'w', encoding = 'utf-8') as f:
+            json.dump({'zones': zones, 'scale': scale, 'profiles': {}}, f)
+        return cls(path)
+
+    @classmethod
+    def exists(cls, path):
+        return path is not None and os.path.exists(str(path)) and os.path.exists(str(path) + '.json')
+
+    @property
+    def profiles(self):
+        return list(self.meta['profiles'])
+
+    def __contains__(self, profile):
+        return profile in self.meta['profiles']
+
+    def add(self, profile, seconds, scale = None):
+        """
+        Agrega (o reemplaza) un perfil. seconds puede ser un arreglo N x N o
+        un DataFrame con índice y columnas de zona, que se reordena.
+        """
+        if isinstance(seconds, pd.DataFrame):
+            seconds = seconds.reindex(index = self.zones, columns = self.zones)
+            seconds = seconds.apply(pd.to_numeric, errors = 'coerce').to_numpy(dtype = np.float64)
+        n = len(self.zones)
+        if np.shape(seconds) != (n, n):
+            raise ValueError(f'Se esperaba una matriz {n}x{n} para {profile}, se recibió {np.shape(seconds)}')
+        scale = scale or self.meta['scale']
+        q = quantize(seconds, scale)
+
+        if profile in self.meta['profiles'] and self.meta['profiles'][profile]['scale'] == scale:
+            offset = self.meta['profiles'][profile]['offset']
+            with open(self.path, 'r+b') as f:
+                f.seek(offset)
+                f.write(q.tobytes())
+        else:
+            with open(self.path, 'ab') as f:
+                offset = f.tell()
+                f.write(q.tobytes())
+        self.meta['profiles'][profile] = {'offset': offset, 'scale': scale}
+        self._matrices.pop(profile, None)
+        with open(self.path + '.json', 'w', encoding = 'utf-8') as f:
+            json.dump(self.meta, f)
+
+    def matrix(self, profile):
+        """Matriz uint16 cuantizada (memmap de sólo lectura)"""
+        if profile not in self._matrices:
+            info = self.meta['profiles'][profile]
+            n = len(self.zones)
+            self._matrices[profile] = np.memmap(self.path, dtype = np.uint16, mode = 'r', offset = info['offset'], shape = (n, n))
+        return self._matrices[profile]
+
+    def seconds(self, profile, dtype = np.float32):
+        """Matriz completa en segundos con NaN donde no hay ruta"""
+        return dequantize(np.asarray(self.matrix(profile)), self.meta['profiles'][profile]['scale'], dtype)
+
+    def frame(self, profile):
+        """Matriz como DataFrame Origen x Destino (mismo formato que durationData)"""
+        return pd.DataFrame(self.seconds(profile), index = self.zones, columns = self.zones)
+
+    def positions(self, zones):
+        pos = self.zones.get_indexer(zones)
+        if (pos < 0).any():
+            raise KeyError(f'Zonas fuera del almacén: {list(pd.Index(zones)[pos < 0][:5])}')
+        return pos
+
+    def lookup(self, profile, origins, destinations, dtype = np.float32):
+        """Tiempo (s) para pares arbitrarios de códigos de zona"""
+        q = self.matrix(profile)[self.positions(origins), self.positions(destinations)]
+        return dequantize(np.asarray(q), self.meta['profiles'][profile]['scale'], dtype)
+
+    def pairs(self, index, profiles = None, prefix = 'travel_time_'):
+        """Columnas travel_time_<perfil> para un MultiIndex (Origen, Destino)"""
+        profiles = profiles or self.profiles
+        o = index.get_level_values('Origen')
+        d = index.get_level_values('Destino')
+        return pd.DataFrame({prefix + p: self.lookup(p, o, d) for p in profiles}, index = index)
@@ -0,0 +1,171 @@
+"""
+Modelo de gravedad calibrado para previsualizar flujos.
+
+Evaluar flux.pkl sobre todos los pares es demasiado lento para iterar en
+ArcGIS Pro. El sustituto usa sólo Viajes Origen / Viajes Destino y los
+tiempos de viaje:
+
+    log1p(T_ij^m) = c0 + c1 log1p(O_i) + c2 log1p(D_j) + sum_p (a_p t_ij^p + b_p log1p(t_ij^p))
+
+con t en minutos por perfil (Driving, Walking). Los coeficientes de cada modo
+se ajustan por mínimos cuadrados contra las predicciones de flux.pkl sobre
+una muestra de orígenes, y la matriz N x N completa se evalúa con unas
+cuantas operaciones de arreglos. calibrate() también reporta el error contra
+el modelo completo en orígenes no usados para el ajuste.
+"""
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from lib.pairs import TARGETS, PROFILES, zoneFeatures, pairFeatures, predictFlows
+
+SAMPLE_ORIGINS = 64
+
+
+def _times(skims, zones, profile):
+    """Matriz N x N de minutos (NaN = sin ruta) desde un SkimStore o dict de DataFrames"""
+    if hasattr(skims, 'seconds'):
+        seconds = skims.seconds(profile)[np.ix_(skims.positions(zones), skims.positions(zones))]
+    else:
+        seconds = skims[profile].reindex(index = zones, columns = zones).to_numpy(dtype = np.float32)
+    return np.asarray(seconds, dtype = np.float32) / 60
+
+
+def _design(logO, logD, times):
+    """Columnas del ajuste para pares ya alineados (vectores de la misma longitud)"""
+    cols = [np.ones_like(logO), logO, logD]
+    for t in times:
+        cols += [t, np.log1p(t)]
+    return np.column_stack(cols)
+
+
+class GravitySurrogate:
+    """Coeficientes (variables x modos) del modelo de gravedad"""
+
+    def __init__(self, coef, targets = TARGETS, profiles = PROFILES):
+        self.coef = np.asarray(coef, dtype = np.float32)
+        self.targets = list(targets)
+        self.profiles = list(profiles)
+
+    @classmethod
+    def fit(cls, pairs, flows, targets = TARGETS, profiles = PROFILES):
+        """
+        pairs   tabla de pairFeatures (Viajes Origen/Destino __ORIGEN/__DESTINO y travel_time_<perfil>)
+        flows   predicciones de flux.pkl para esos pares
+        """
+        times = [pairs[f'travel_time_{p}'].to_numpy(dtype = np.float32) / 60 for p in profiles]
+        valid = np.all([t > 0 for t in times], axis = 0) | (pairs.index.get_level_values('Origen') == pairs.index.get_level_values('Destino'))
+        A = _design(np.log1p(pairs['Viajes Origen__ORIGEN'].to_numpy(dtype = np.float32)),
+                    np.log1p(pairs['Viajes Destino__DESTINO'].to_numpy(dtype = np.float32)), times)
+        Y = np.log1p(np.clip(flows[targets].to_numpy(dtype = np.float32), 0, None))
+        coef = np.linalg.lstsq(A[valid], Y[valid], rcond = None)[0]
+        return cls(coef, targets, profiles)
+
+    def matrices(self, origins, destinations, times):
+        """
+        origins, destinations   Viajes Origen / Viajes Destino por zona (N)
+        times                   lista de matrices N x N en minutos, una por perfil
+        Regresa un arreglo modos x N x N de flujos enteros.
+        """
+        logO = np.log1p(np.asarray(origins, dtype = np.float32))
+        logD = np.log1p(np.asarray(destinations, dtype = np.float32))
+        blocks = []
+        for t in times:
+            blocks += [t, np.log1p(t)]
+        B = np.stack(blocks)
+        c = self.coef
+        Z = np.einsum('kij,km->mij', B, c[3:], optimize = True)
+        Z += c[0][:, None, None] + c[1][:, None, None] * logO[None, :, None]
+        Z += c[2][:, None, None] * logD[None, None, :]
+        # Sin ruta no hay flujo
+        Z[:, np.isnan(B).any(axis = 0)] = 0
+        return np.rint(np.clip(np.expm1(Z), 0, None)).astype(np.int32)
+
+    def flows(self, joining, skims, index = None):
+        """
+        Flujos previstos en formato y_pred (índice Origen, Destino; una
+        columna por modo) para todas las zonas de joining o sólo para index.
+        """
+        joining = zoneFeatures(joining)
+        zones = joining.index
+        F = self.matrices(joining['Viajes Origen'], joining['Viajes Destino'], [_times(skims, zones, p) for p in self.profiles])
+        n = len(zones)
+        full = pd.MultiIndex.from_arrays([zones.repeat(n), np.tile(zones.to_numpy(), n)], names = ['Origen', 'Destino'])
+        y_pred = pd.DataFrame(F.reshape(len(self.targets), -1).T, index = full, columns = self.targets)
+        return y_pred if index is None else y_pred.reindex(index, fill_value = 0)
+
+    def save(self, path):
+        with open(path, 'w', encoding = 'utf-8') as f:
+            json.dump({'targets': self.targets, 'profiles': self.profiles, 'coef': self.coef.tolist()}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding = 'utf-8') as f:
+            meta = json.load(f)
+        return cls(meta['coef'], meta['targets'], meta['profiles'])
+
+
+def errorReport(full, preview, targets = TARGETS):
+    """Error del sustituto contra flux.pkl por modo: rmse, mae, r2 y cociente de totales"""
+    report = {}
+    for t in targets:
+        y = full[t].to_numpy(dtype = np.float64)
+        p = preview[t].reindex(full.index, fill_value = 0).to_numpy(dtype = np.float64)
+        ss = ((y - y.mean())**2).sum()
+        report[t] = {
+            'rmse'      : float(np.sqrt(np.mean((y - p)**2))),
+            'mae'       : float(np.mean(np.abs(y - p))),
+            'r2'        : float(1 - ((y - p)**2).sum() / ss) if ss > 0 else None,
+            'totalRatio': float(p.sum() / y.sum()) if y.sum() > 0 else None,
+        }
+    return report
+
+
+def calibrate(model, joining, skims, targets = TARGETS, profiles = PROFILES, sampleOrigins = SAMPLE_ORIGINS, seed = 4):
+    """
+    Ajusta el sustituto con las predicciones de flux.pkl para sampleOrigins
+    orígenes (x todos los destinos) y lo valida con otros tantos.
+    Regresa (GravitySurrogate, reporte de error y tiempos).
+    """
+    joining = zoneFeatures(joining)
+    zones = joining.index
+    order = np.random.default_rng(seed).permutation(len(zones))
+    fitZones = zones[order[:sampleOrigins]]
+    testZones = zones[order[sampleOrigins:2 * sampleOrigins]]
+
+    pairs = pairFeatures(joining, fitZones, skims = skims, profiles = profiles)
+    surrogate = GravitySurrogate.fit(pairs, predictFlows(model, pairs, targets), targets, profiles)
+
+    start = time.perf_counter()
+    preview = surrogate.flows(joining, skims)
+    previewSeconds = time.perf_counter() - start
+
+    report = {'fitOrigins': len(fitZones), 'testOrigins': len(testZones), 'previewSeconds': previewSeconds}
+    if len(testZones):
+        pairs = pairFeatures(joining, testZones, skims = skims, profiles = profiles)
+        start = time.perf_counter()
+        full = predictFlows(model, pairs, targets)
+        # Tiempo estimado de flux.pkl para todos los pares
+        report['fullSeconds'] = (time.perf_counter() - start) * len(zones) / len(testZones)
+        report['error'] = errorReport(full, preview, targets)
+    return surrogate, report
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = 'Calibra el modelo de gravedad para previsualizar flujos')
+    parser.add_argument('--fullData', required = True)
+    parser.add_argument('--skims', required = True, help = 'SkimStore con los perfiles Driving y Walking')
+    parser.add_argument('--modelDir', default = './model')
+    parser.add_argument('--out', default = './model/surrogate.json')
+    parser.add_argument('--sampleOrigins', type = int, default = SAMPLE_ORIGINS)
+    args = parser.parse_args()
+
+    from lib.pairs import loadModel, readFullData, zoneTable
+    from lib.skims import SkimStore
+
+    joining = zoneTable(readFullData(args.fullData), loadModel('origen.pkl', args.modelDir), loadModel('destino.pkl', args.modelDir))
+    surrogate, report = calibrate(loadModel('flux.pkl', args.modelDir), joining, SkimStore(args.skims), sampleOrigins = args.sampleOrigins)
+    surrogate.save(args.out)
+    print(json.dumps(report, indent = 2))
@@ -0,0 +1,123 @@
+"""
+Generador de datos sintéticos con la forma de los insumos del pipeline.
+
+Las zonas son una malla de cuadros alrededor de Guadalajara (polígonos WKT y
+centroides en grados), con columnas tipo fullData, una encuesta OD, puntos
+de DENUE / paradas GTFS / estaciones MiBici y skims falsos de auto y a pie.
+No requiere arcpy ni red.
+"""
+import numpy as np
+import pandas as pd
+
+CENTER = (-103.35, 20.67)
+CELL = 0.01  # grados (~1 km)
+
+ACTS = ['act_722515', 'act_722514', 'act_812110']
+
+OD_MODES = ['Caminando', 'Transporte_Colectivo', 'Taxi', 'Auto_Conductor', 'Auto_Acompañante',
+            'Camioneta', 'Bicicleta', 'Motocicleta', 'Otros']
+
+SPEEDS = {'Driving': 8.0, 'Walking': 1.3}  # m/s
+
+
+def zones(n, seed = 0):
+    """Malla de n zonas: CODIGO_MZ, PX, PY y geometría WKT"""
+    side = int(np.ceil(np.sqrt(n)))
+    i = np.arange(n)
+    col, row = i % side, i // side
+    x0 = CENTER[0] - side * CELL / 2 + col * CELL
+    y0 = CENTER[1] - side * CELL / 2 + row * CELL
+    rng = np.random.default_rng(seed)
+    # El punto interior no siempre es el centro del cuadro
+    px = x0 + CELL * rng.uniform(0.3, 0.7, n)
+    py = y0 + CELL * rng.uniform(0.3, 0.7, n)
+    wkt = [f'POLYGON (({a} {b}, {a + CELL} {b}, {a + CELL} {b + CELL}, {a} {b + CELL}, {a} {b}))' for a, b in zip(x0, y0)]
+    return pd.DataFrame({'CODIGO_MZ': 1000 + i, 'PX': px, 'PY': py, 'col': col, 'row': row, 'geometry': wkt})
+
+
+def fullData(z, seed = 0):
+    """Variables por zona con los nombres de fullData.csv"""
+    rng = np.random.default_rng(seed + 1)
+    n = len(z)
+    pob = rng.lognormal(7.5, 0.8, n).round()
+    viv = (pob / rng.uniform(3, 4.5, n)).round()
+    df = pd.DataFrame({
+        'CODIGO_MZ'         : z['CODIGO_MZ'].to_numpy(),
+        'CVE_MUN'           : 39 + (z['col'] * 5 // (z['col'].max() + 1)).to_numpy(),
+        'sum_POBTOT'        : pob,
+        'sum_TVIVPARHAB'    : viv,
+        'sum_VPH_AUTOM'     : (viv * rng.uniform(0.2, 0.8, n)).round(),
+        'Unidades_Economicas': rng.poisson(40, n),
+        'Paradas_Camion'    : rng.poisson(6, n),
+    })
+    for act in ACTS:
+        df[act] = rng.poisson(3, n)
+    df['datosAgrupados_Total_origen'] = (pob * rng.uniform(0.8, 1.6, n)).round()
+    df['datosAgrupados_Total_destino'] = (df['Unidades_Economicas'] * rng.uniform(10, 30, n)).round()
+    return df
+
+
+def distances(z):
+    """Matriz N x N de distancia euclidiana aproximada en metros"""
+    x = z['PX'].to_numpy() * 104_000
+    y = z['PY'].to_numpy() * 111_000
+    return np.hypot(x[:, None] - x[None], y[:, None] - y[None]).astype(np.float32)
+
+
+def skims(z, seed = 0, missing = 0.002):
+    """Skims falsos (segundos) con algunos pares sin ruta"""
+    rng = np.random.default_rng(seed + 2)
+    dist = distances(z)
+    out = {}
+    for mode, speed in SPEEDS.items():
+        t = dist * np.float32(1.3) / np.float32(speed) + np.float32(60)
+        t *= rng.uniform(0.9, 1.2, t.shape).astype(np.float32)
+        t[rng.random(t.shape) < missing] = np.nan
+        np.fill_diagonal(t, 0)
+        out[mode] = t
+    return out
+
+
+def odSurvey(z, seed = 0, maxPairs = 2_000_000):
+    """Encuesta OD con las columnas de OD2007Estimacion2014 (muestra de pares)"""
+    rng = np.random.default_rng(seed + 3)
+    n = len(z)
+    codes = z['CODIGO_MZ'].to_numpy()
+    nPairs = min(n * n, maxPairs)
+    flat = np.arange(n * n) if nPairs == n * n else np.sort(rng.choice(n * n, nPairs, replace = False))
+    o, d = np.divmod(flat, n)
+    dist = np.hypot((z['PX'].to_numpy()[o] - z['PX'].to_numpy()[d]) * 104_000,
+                    (z['PY'].to_numpy()[o] - z['PY'].to_numpy()[d]) * 111_000)
+    base = 50 * np.exp(-dist / 4000)
+    df = pd.DataFrame({'Origen': codes[o], 'Destino': codes[d]})
+    for mode in OD_MODES:
+        df[mode] = rng.poisson(base * rng.uniform(0.05, 0.3))
+    df['Total'] = df[OD_MODES].sum(axis = 1)
+    return df
+
+
+def points(z, n, seed = 0, kind = 'denue'):
+    """Puntos (lon, lat) dentro de la malla; DENUE trae codigo_act"""
+    rng = np.random.default_rng(seed + 4 + len(kind))
+    idx = rng.integers(0, len(z), n)
+    df = pd.DataFrame({
+        'lon': z['PX'].to_numpy()[idx] + rng.uniform(-0.3, 0.3, n) * CELL,
+        'lat': z['PY'].to_numpy()[idx] + rng.uniform(-0.3, 0.3, n) * CELL,
+    })
+    if kind == 'denue':
+        df['codigo_act'] = rng.choice([a.split('_')[1] for a in ACTS] + ['461110', '311812'], n)
+    return df
+
+
+def dataset(nZones, seed = 0, maxPairs = 2_000_000):
+    """Todos los insumos sintéticos para nZones zonas"""
+    z = zones(nZones, seed)
+    return {
+        'zones'     : z,
+        'fullData'  : fullData(z, seed),
+        'od'        : odSurvey(z, seed, maxPairs),
+        'denue'     : points(z, nZones * 40, seed, 'denue'),
+        'gtfs'      : points(z, nZones * 6, seed, 'gtfs'),
+        'mibici'    : points(z, max(1, nZones // 2), seed, 'mibici'),
+        'skims'     : skims(z, seed),
+    }
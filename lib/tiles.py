@@ -0,0 +1,161 @@
+"""
+Modo por bloques (out-of-core) para modelar OD a nivel manzana.
+
+Con decenas de miles de zonas la tabla N^2 de fluxModel.py (odcopy,
+travelData, y_pred) no cabe en memoria. Aquí se recorren bloques de orígenes
+x destinos: se construyen los predictores del bloque (lib/pairs.py) leyendo
+los skims del SkimStore en memmap, se evalúa el modelo y el resultado
+disperso se escribe a disco. Cada bloque terminado queda en su propio
+archivo, así que una corrida interrumpida continúa donde se quedó; al final
+los bloques se unen en una sola salida.
+"""
+import os
+import json
+import glob
+import argparse
+import pandas as pd
+from lib.pairs import PROFILES, TARGETS, numericColumns, pairFeatures, predictFlows
+from lib.odwriter import toSparse, writeChunks, readSparse
+
+MEMORY_BUDGET = 2 * 1024**3  # bytes
+# Copias vivas de la tabla de predictores por par (bloques __ORIGEN/__DESTINO, hstack, DataFrame, modelo)
+OVERHEAD = 4
+
+
+def tileShape(nZones, nFeatures, memoryBudget = MEMORY_BUDGET, nTargets = len(TARGETS)):
+    """Orígenes y destinos por bloque para que un bloque quepa en memoryBudget"""
+    bytesPerPair = (nFeatures * OVERHEAD + nTargets * 3) * 4
+    pairs = max(1, memoryBudget // bytesPerPair)
+    destinations = int(min(nZones, pairs))
+    origins = int(max(1, min(nZones, pairs // destinations)))
+    return origins, destinations
+
+
+class TiledRun:
+    """
+    Estado de una corrida por bloques en workDir:
+        manifest.json           zonas, tamaño de bloque y salida
+        part_<i>_<j>.<ext>      COO de cada bloque terminado
+    """
+
+    def __init__(self, workDir, joining, skims, model, profiles = PROFILES, targets = TARGETS,
+                 memoryBudget = MEMORY_BUDGET, fmt = 'parquet'):
+        self.workDir = workDir
+        self.joining = joining
+        self.skims = skims
+        self.model = model
+        self.profiles = profiles
+        self.targets = targets
+        self.fmt = fmt
+        os.makedirs(workDir, exist_ok = True)
+
+        nFeatures = 2 * len(numericColumns(joining)) + len(profiles)
+        manifest = self._readManifest()
+        if manifest is None:
+            self.tileOrigins, self.tileDestinations = tileShape(len(joining), nFeatures, memoryBudget, len(targets))
+            self._writeManifest()
+        else:
+            # Al reanudar se respeta el tamaño de bloque original
+            if manifest['zones'] != len(joining):
+                raise ValueError(f'{workDir} es de una corrida con {manifest["zones"]} zonas, no {len(joining)}')
+            self.tileOrigins = manifest['tileOrigins']
+            self.tileDestinations = manifest['tileDestinations']
+            self.fmt = manifest['format']
+
+    def _manifestPath(self):
+        return os.path.join(self.workDir, 'manifest.json')
+
+    def _readManifest(self):
+        if not os.path.exists(self._manifestPath()):
+            return None
+        with open(self._manifestPath(), 'r', encoding = 'utf-8') as f:
+            return json.load(f)
+
+    def _writeManifest(self):
+        with open(self._manifestPath(), 'w', encoding = 'utf-8') as f:
+            json.dump({'zones': len(self.joining), 'tileOrigins': self.tileOrigins,
+                       'tileDestinations': self.tileDestinations, 'format': self.fmt,
+                       'targets': list(self.targets), 'profiles': list(self.profiles)}, f)
+
+    def tiles(self):
+        n = len(self.joining)
+        for i, o in enumerate(range(0, n, self.tileOrigins)):
+            for j, d in enumerate(range(0, n, self.tileDestinations)):
+                yield i, j, slice(o, o + self.tileOrigins), slice(d, d + self.tileDestinations)
+
+    def partPath(self, i, j):
+        return os.path.join(self.workDir, f'part_{i:05d}_{j:05d}.{self.fmt}')
+
+    def pending(self):
+        return [t for t in self.tiles() if not os.path.exists(self.partPath(t[0], t[1]))]
+
+    def runTile(self, i, j, origins, destinations):
+        zones = self.joining.index
+        pairs = pairFeatures(self.joining, zones[origins], zones[destinations], self.skims, self.profiles)
+        sparse = toSparse(predictFlows(self.model, pairs, self.targets))
+        # Se escribe a un temporal y se renombra para que un bloque a medias no cuente como terminado
+        path = self.partPath(i, j)
+        tmp = path + '.tmp'
+        writeChunks([sparse], tmp, fmt = self.fmt)
+        os.replace(tmp, path)
+        return len(pairs), len(sparse)
+
+    def run(self, trace = None):
+        """Procesa los bloques pendientes; regresa (pares evaluados, pares con flujo)"""
+        for tmp in glob.glob(os.path.join(self.workDir, '*.tmp')):
+            os.remove(tmp)
+        pending = self.pending()
+        total = sum(1 for _ in self.tiles())
+        scored = kept = 0
+        for k, (i, j, o, d) in enumerate(pending):
+            nPairs, nKept = self.runTile(i, j, o, d)
+            scored += nPairs
+            kept += nKept
+            if trace is not None:
+                trace.count('tiles')
+                trace.message(f'    Tile {total - len(pending) + k + 1}/{total}: {nKept} of {nPairs} pairs with flow')
+        return scored, kept
+
+    def parts(self):
+        return sorted(glob.glob(os.path.join(self.workDir, f'part_*.{self.fmt}')))
+
+    def merge(self, path):
+        """Une los bloques en una sola salida COO (.parquet o .csv), bloque por bloque"""
+        if self.pending():
+            raise RuntimeError(f'Faltan {len(self.pending())} bloques por procesar en {self.workDir}')
+        return writeChunks((readSparse(p) for p in self.parts()), path)
+
+
+def runTiled(workDir, joining, skims, model, outPath, trace = None, **kwargs):
+    """Corre (o reanuda) todos los bloques y une el resultado en outPath"""
+    run = TiledRun(workDir, joining, skims, model, **kwargs)
+    run.run(trace)
+    return run.merge(outPath)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = 'Modelo de flujo OD por bloques con memoria acotada')
+    parser.add_argument('--fullData', required = True)
+    parser.add_argument('--skims', required = True, help = 'SkimStore con los perfiles Driving y Walking')
+    parser.add_argument('--modelDir', default = './model')
+    parser.add_argument('--workDir', required = True)
+    parser.add_argument('--out', required = True, help = 'Salida COO .parquet o .csv')
+    parser.add_argument('--memoryGB', type = float, default = MEMORY_BUDGET / 1024**3)
+    parser.add_argument('--format', default = 'parquet', choices = ['parquet', 'csv'])
+    args = parser.parse_args()
+
+    from lib.pairs import loadModel, readFullData, zoneTable
+    from lib.skims import SkimStore
+    from lib.trace import Tracer
+
+    trace = Tracer()
+    with trace.stage('Zone Table'):
+        joining = zoneTable(readFullData(args.fullData), loadModel('origen.pkl', args.modelDir), loadModel('destino.pkl', args.modelDir))
+    with trace.stage('Tiles', rowsIn = len(joining)**2) as span:
+        run = TiledRun(args.workDir, joining, SkimStore(args.skims), loadModel('flux.pkl', args.modelDir),
+                       memoryBudget = int(args.memoryGB * 1024**3), fmt = args.format)
+        span.rowsOut = run.run(trace)[1]
+    with trace.stage('Merge'):
+        run.merge(args.out)
+    trace.end()
@@ -0,0 +1,183 @@
+"""
+Instrumentación de etapas del pipeline.
+
+Cada etapa es un span con tiempo de reloj y de CPU, pico de memoria (RSS),
+filas de entrada/salida y contadores (llamadas al ruteador, aciertos de
+caché, ...). Los spans se escriben como JSON lines y al final se imprime una
+tabla resumen. Los mensajes se reenvían a arcpy.AddMessage cuando el script
+corre dentro del toolbox. Opcionalmente cada etapa se perfila con cProfile.
+
+    trace = Tracer('run.jsonl')
+    with trace.stage('Flux Model', rowsIn = len(odcopy)) as span:
+        ...
+        span.rowsOut = len(y_pred)
+
+Para scripts lineales, trace.begin('OD') cierra la etapa anterior del mismo
+nivel y abre una nueva.
+"""
+import os
+import sys
+import json
+import time
+import cProfile
+from contextlib import contextmanager
+
+
+def peakRss():
+    """Pico de memoria residente del proceso en MB (None si no está disponible)"""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset / 1024**2
+        except (ImportError, AttributeError):
+            return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024**2 if sys.platform == 'darwin' else rss / 1024
+
+
+def _arcpy():
+    """arcpy sólo si ya fue importado (es decir, estamos dentro del toolbox)"""
+    return sys.modules.get('arcpy')
+
+
+class Span:
+    def __init__(self, name, depth, rowsIn = None, t0 = 0.0):
+        self.name = name
+        self.t0 = t0
+        self.depth = depth
+        self.rowsIn = rowsIn
+        self.rowsOut = None
+        self.counters = {}
+        self.start = time.perf_counter()
+        self.cpu = time.process_time()
+        self.rss = peakRss()
+        self.profiler = None
+
+    def count(self, counter, n = 1):
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def record(self):
+        rss = peakRss()
+        return {
+            'stage'     : self.name,
+            'depth'     : self.depth,
+            'offset'    : self.start - self.t0,
+            'wall'      : time.perf_counter() - self.start,
+            'cpu'       : time.process_time() - self.cpu,
+            'peakRss'   : rss,
+            'rssGrowth' : rss - self.rss if rss is not None and self.rss is not None else None,
+            'rowsIn'    : self.rowsIn,
+            'rowsOut'   : self.rowsOut,
+            'counters'  : self.counters,
+        }
+
+
+class Tracer:
+    def __init__(self, path = None, debug = False, profile = (), forward = True):
+        """
+        path        archivo JSON lines (None para no escribir)
+        debug       muestra los mensajes de trace.debug()
+        profile     nombres de etapas a perfilar con cProfile, o True para todas
+        forward     reenvía los mensajes a arcpy.AddMessage si arcpy está cargado
+        """
+        self.path = path
+        self.debugEnabled = debug
+        self.profile = profile
+        self.forward = forward
+        self.stack = []
+        self.records = []
+        self.t0 = time.perf_counter()
+        if path:
+            open(path, 'w').close()
+
+    # Mensajes
+
+    def message(self, text):
+        arcpy = _arcpy() if self.forward else None
+        if arcpy is not None:
+            arcpy.AddMessage(text)
+        else:
+            print(text)
+        self._write({'event': 'message', 'text': str(text), 'time': time.time()})
+
+    def debug(self, text):
+        if self.debugEnabled:
+            self.message(text)
+
+    # Spans
+
+    @property
+    def current(self):
+        return self.stack[-1] if self.stack else None
+
+    def count(self, counter, n = 1):
+        """Suma al contador de la etapa actual y de todas las que la contienen"""
+        for span in self.stack:
+            span.count(counter, n)
+
+    def _profiled(self, name):
+        return self.profile is True or name in (self.profile or ())
+
+    def open(self, name, rowsIn = None):
+        span = Span(name, len(self.stack), rowsIn, self.t0)
+        self.message('  ' * span.depth + name)
+        if self._profiled(name):
+            span.profiler = cProfile.Profile()
+            span.profiler.enable()
+        self.stack.append(span)
+        return span
+
+    def close(self, rowsOut = None):
+        span = self.stack.pop()
+        if span.profiler is not None:
+            span.profiler.disable()
+            if self.path:
+                span.profiler.dump_stats(f'{os.path.splitext(self.path)[0]}.{span.name.replace(" ", "_")}.prof')
+        if rowsOut is not None:
+            span.rowsOut = rowsOut
+        rec = span.record()
+        self.records.append(rec)
+        self._write({'event': 'stage', **rec})
+        return rec
+
+    @contextmanager
+    def stage(self, name, rowsIn = None):
+        span = self.open(name, rowsIn)
+        try:
+            yield span
+        finally:
+            while self.stack and self.stack[-1] is not span:
+                self.close()
+            self.close()
+
+    def begin(self, name, rowsIn = None, depth = 0):
+        """Cierra las etapas abiertas en depth o más y abre una nueva"""
+        while len(self.stack) > depth:
+            self.close()
+        return self.open(name, rowsIn)
+
+    def end(self):
+        """Cierra todas las etapas abiertas y manda el resumen"""
+        while self.stack:
+            self.close()
+        self.message(self.summary())
+
+    # Salida
+
+    def _write(self, record):
+        if self.path:
+            with open(self.path, 'a', encoding = 'utf-8') as f:
+                f.write(json.dumps(record, default = str) + '\n')
+
+    def summary(self):
+        lines = [f'{"Stage":<36}{"Wall s":>9}{"CPU s":>9}{"Peak MB":>10}{"Rows in":>11}{"Rows out":>11}  Counters']
+        for r in sorted(self.records, key = lambda r: r['offset']):
+            name = '  ' * r['depth'] + r['stage']
+            peak = f"{r['peakRss']:.0f}" if r['peakRss'] is not None else '-'
+            counters = ', '.join(f'{k}={v}' for k, v in r['counters'].items())
+            lines.append(f"{name[:35]:<36}{r['wall']:>9.2f}{r['cpu']:>9.2f}{peak:>10}"
+                         f"{r['rowsIn'] if r['rowsIn'] is not None else '-':>11}"
+                         f"{r['rowsOut'] if r['rowsOut'] is not None else '-':>11}  {counters}")
+        return '\n'.join(lines)
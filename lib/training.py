@@ -0,0 +1,175 @@
+"""
+Entrenamiento de los modelos XGBoost (origen.pkl, destino.pkl, flux_xgb.pkl).
+
+Reemplaza el GridSearchCV de xgboost.ipynb por successive halving con early
+stopping: las particiones de validación cruzada se construyen una sola vez
+como DMatrix, los folds se entrenan en paralelo con hilos controlados y en
+cada ronda sólo sobrevive la mejor fracción de configuraciones con un
+presupuesto de árboles mayor.
+
+Los modelos se guardan en OUT_DIR, no en ./model: el flux.pkl que usa
+fluxModel.py es una red de Keras, y el modelo de flujo de XGBoost es otra
+familia de modelo (flux_xgb.pkl). Para usarlo hay que copiarlo a mano o
+apuntar FLUX_MODEL a él.
+"""
+import os
+import pickle
+import itertools
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from concurrent.futures import ThreadPoolExecutor
+from lib.augment import augment
+
+SEED = 4
+
+OUT_DIR = './model/trained'
+FLUX_FILE = 'flux_xgb.pkl'
+
+PARAM_GRID = {
+    'colsample_bytree'  : list(np.linspace(0.5, 0.9, 5)),  # porcentaje de variables por árbol
+    'max_depth'         : [10, 15, 20, 25],                # profundidades
+}
+
+BASE_PARAMS = {
+    'objective'     : 'reg:squarederror',
+    'eval_metric'   : 'rmse',
+    'tree_method'   : 'hist',
+    'seed'          : SEED,
+}
+
+ZONE_TARGETS = {
+    'origen'    : 'datosAgrupados_Total_origen',
+    'destino'   : 'datosAgrupados_Total_destino',
+}
+
+FLUX_TARGETS = ['Caminando', 'Transporte_Colectivo', 'Taxi', 'Bicicleta', 'Motocicleta', 'Vehiculo', 'Otros', 'Total']
+
+
+def gridConfigs(grid = PARAM_GRID):
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*grid.values())]
+
+
+def foldMatrices(X, y, nFolds = 5, seed = SEED):
+    """Construye una sola vez los pares (dtrain, dvalid) de cada fold"""
+    X = np.asarray(X, dtype = np.float32)
+    y = np.asarray(y, dtype = np.float32)
+    order = np.random.default_rng(seed).permutation(len(X))
+    folds = []
+    for valid in np.array_split(order, nFolds):
+        train = np.setdiff1d(order, valid, assume_unique = True)
+        folds.append((xgb.DMatrix(X[train], label = y[train]), xgb.DMatrix(X[valid], label = y[valid])))
+    return folds
+
+
+def _threads(nJobs, nThreads):
+    nThreads = nThreads or os.cpu_count() or 1
+    nJobs = max(1, min(nJobs, nThreads))
+    return nJobs, max(1, nThreads // nJobs)
+
+
+def crossValidate(params, folds, numRounds, earlyStopping = 20, nJobs = None, nThreads = None):
+    """
+    Entrena todos los folds en paralelo; regresa (rmse medio, mejor iteración media).
+    Cada fold usa nThreads // nJobs hilos de xgboost para no sobresuscribir el CPU.
+    """
+    nJobs, perFold = _threads(nJobs or len(folds), nThreads)
+    params = {**BASE_PARAMS, **params, 'nthread': perFold}
+
+    def fit(fold):
+        dtrain, dvalid = fold
+        booster = xgb.train(params, dtrain, num_boost_round = numRounds, evals = [(dvalid, 'valid')],
+                            early_stopping_rounds = earlyStopping, verbose_eval = False)
+        return booster.best_score, booster.best_iteration + 1
+
+    with ThreadPoolExecutor(max_workers = nJobs) as pool:
+        results = list(pool.map(fit, folds))
+    scores, rounds = zip(*results)
+    return float(np.mean(scores)), int(np.mean(rounds))
+
+
+def successiveHalving(folds, grid = PARAM_GRID, minRounds = 25, maxRounds = 200, factor = 3, **kwargs):
+    """
+    Evalúa todas las configuraciones con minRounds árboles, conserva el mejor
+    1/factor y multiplica el presupuesto por factor hasta maxRounds.
+    Regresa (mejores parámetros, número de árboles, historial).
+    """
+    candidates = gridConfigs(grid)
+    budget = minRounds
+    history = []
+    while True:
+        scored = []
+        for params in candidates:
+            score, rounds = crossValidate(params, folds, budget, **kwargs)
+            scored.append((score, rounds, params))
+            history.append({'budget': budget, 'score': score, 'rounds': rounds, **params})
+        scored.sort(key = lambda r: r[0])
+        if len(scored) == 1 or budget >= maxRounds:
+            best = scored[0]
+            return best[2], best[1], pd.DataFrame(history)
+        candidates = [p for _, _, p in scored[:max(1, len(scored) // factor)]]
+        budget = min(maxRounds, budget * factor)
+
+
+def trainModel(X, y, grid = PARAM_GRID, nFolds = 5, seed = SEED, **kwargs):
+    """Busca hiperparámetros y reentrena un XGBRegressor con todos los datos"""
+    folds = foldMatrices(X, y, nFolds, seed)
+    params, rounds, history = successiveHalving(folds, grid, **kwargs)
+    model = xgb.XGBRegressor(objective = BASE_PARAMS['objective'], tree_method = BASE_PARAMS['tree_method'],
+                             seed = seed, n_estimators = rounds, n_jobs = kwargs.get('nThreads'), **params)
+    model.fit(X, y)
+    return model, history
+
+
+def saveModel(model, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok = True)
+    with open(path, 'wb') as f:
+        pickle.dump(model, f)
+
+
+def trainZoneModels(data, predictors = None, outDir = OUT_DIR, **kwargs):
+    """Genera origen.pkl y destino.pkl a partir de selectedData"""
+    predictors = predictors or [x for x in data.columns if x not in ZONE_TARGETS.values()]
+    histories = {}
+    for name, target in ZONE_TARGETS.items():
+        model, histories[name] = trainModel(data[predictors], data[target], **kwargs)
+        saveModel(model, os.path.join(outDir, f'{name}.pkl'))
+    return histories
+
+
+def fluxPredictors(data, targets = FLUX_TARGETS):
+    """Mismo criterio de predictores que fluxModel.py"""
+    categorical = data.select_dtypes(include=['object']).columns
+    codes = [x for x in data.columns if 'CODIGO' in x]
+    return [x for x in data.columns if x not in targets and x not in categorical and x not in codes]
+
+
+def trainFluxModel(data, targets = FLUX_TARGETS, outDir = OUT_DIR, **kwargs):
+    """Genera flux_xgb.pkl (un solo modelo multi-salida) a partir de fluxModelData"""
+    model, history = trainModel(data[fluxPredictors(data, targets)], data[targets], **kwargs)
+    saveModel(model, os.path.join(outDir, FLUX_FILE))
+    return history
+
+
+def trainFluxModelFromDataset(path, targets = FLUX_TARGETS, outDir = OUT_DIR, **kwargs):
+    """Como trainFluxModel pero leyendo la tabla particionada de lib/dataset.py"""
+    from lib.dataset import TrainingDataset
+
+    X, y = TrainingDataset(path).frame(targets = targets)
+    model, history = trainModel(X, y, **kwargs)
+    saveModel(model, os.path.join(outDir, FLUX_FILE))
+    return history
+
+
+if __name__ == '__main__':
+
+    data = pd.read_csv('./data/selectedData.csv', index_col='CODIGO_MZ')
+    # Datos sinteticos
+    print(trainZoneModels(augment(data, 1000, seed=SEED)))
+
+    if os.path.exists('./data/fluxModelData/manifest.json'):
+        print(trainFluxModelFromDataset('./data/fluxModelData'))
+    else:
+        fluxData = pd.read_csv('./data/fluxModelData.csv', index_col=['Origen', 'Destino'])
+        print(trainFluxModel(fluxData))
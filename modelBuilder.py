@@ -10,6 +10,11 @@ import arcpy
 import zipfile
 import pandas as pd
 from lib.utils import arcgis_table_to_df
+from lib.trace import Tracer
+
+# Trazas por etapa en JSON lines y etapas a perfilar con cProfile (ver lib/trace.py)
+TRACE_FILE = None
+PROFILE_STAGES = ()
 
 if __name__ == '__main__':
 
@@ -46,9 +51,11 @@ if __name__ == '__main__':
     tmpFoldertxt    = arcpy.GetParameterAsText(10)
     tmpBool         = arcpy.GetParameter(11)
 
+    trace = Tracer(TRACE_FILE, profile = PROFILE_STAGES)
+
 
     #! Tmp Data Storage
-    arcpy.AddMessage(f'Creating tmpDatabase')
+    trace.begin('Creating tmpDatabase')
 
     tmpGDB = 'tmpGeoDB.gdb'
     arcpy.management.CreateFileGDB(
@@ -57,14 +64,14 @@ if __name__ == '__main__':
         out_version     = "CURRENT"
     )
     tmpDataPath = tmpFoldertxt + '\\' + tmpGDB
-    arcpy.AddMessage(rf'Created: {tmpDataPath}')
+    trace.message(rf'Created: {tmpDataPath}')
     # Ponemos la geodatabase temporal como espacio para guardar los datos del script
     arcpy.env.workspace = tmpDataPath
 
     arcpy.ImportToolbox(r"C:\Users\Rafael\OneDrive - ITESO\2023.3 Otoño\PAP\MyProject\papMovilidad.atbx")
 
     #! OD
-    arcpy.AddMessage('Starting OD')
+    trace.begin('Starting OD')
 
     # Aquí creamos la agrupación de datos
     arcpy.papMovilidad.JoinDataOD(
@@ -83,7 +90,7 @@ if __name__ == '__main__':
     )
 
     #! DENUE
-    arcpy.AddMessage('Starting DENUE')
+    trace.begin('Starting DENUE')
 
     # Summarize DENUE
     arcpy.analysis.SummarizeWithin(
@@ -138,7 +145,7 @@ if __name__ == '__main__':
     )
 
     #! MiBici
-    arcpy.AddMessage('Starting MiBici')
+    trace.begin('Starting MiBici')
 
     # Ploteamos los puntos de MiBici
     arcpy.management.XYTableToPoint(
@@ -148,7 +155,7 @@ if __name__ == '__main__':
         y_field             = yField
     )
 
-    arcpy.AddMessage('  Select')
+    trace.begin('Select', depth = 1)
     # Seleccionamos solo las estaciones activas
     arcpy.management.SelectLayerByAttribute(
         in_layer_or_view    = "estacionesmibici_XYTableToPoint",
@@ -157,7 +164,7 @@ if __name__ == '__main__':
         invert_where_clause = None
     )
 
-    arcpy.AddMessage('  Summarize')
+    trace.begin('Summarize', depth = 1)
     # Sacamos cuantas estaciones activas hay por zona
     arcpy.analysis.SummarizeWithin(
         in_polygons         = zonifica,
@@ -173,7 +180,7 @@ if __name__ == '__main__':
         out_group_table     = None
     )
 
-    arcpy.AddMessage('  Export')
+    trace.begin('Export', depth = 1)
     # Exportamos los datos que queremos a otra tabla para poder darles tratamiento
     arcpy.conversion.ExportTable(
         in_table                = 'zonificacionMiBici',
@@ -184,7 +191,7 @@ if __name__ == '__main__':
         sort_field              = None
     )
 
-    arcpy.AddMessage('  Alter Field')
+    trace.begin('Alter Field', depth = 1)
     # Renombramos la columna
     arcpy.management.AlterField(
         in_table            = 'zonMB',
@@ -197,7 +204,7 @@ if __name__ == '__main__':
         clear_field_alias   = "DO_NOT_CLEAR"
     )
 
-    arcpy.AddMessage(f'  Add Join in {zonificaCode}')
+    trace.begin(f'Add Join in {zonificaCode}', depth = 1)
     # Añadimos los datos de MiBici a Zonificación
     arcpy.management.JoinField(
         in_data     = 'zonificaDEN',
@@ -212,7 +219,7 @@ if __name__ == '__main__':
     )
 
     #! GTFS
-    arcpy.AddMessage('Starting GTFS')
+    trace.begin('Starting GTFS')
 
     gtfsLoc = tmpFoldertxt + '\\gtfs'
 
@@ -295,7 +302,7 @@ if __name__ == '__main__':
     )
 
     #! CENSO
-    arcpy.AddMessage('Starting Censo')
+    trace.begin('Starting Censo')
 
     # Aquí obtenemos el censo por manzanas
     arcpy.papMovilidad.CensoManzanas(
@@ -356,7 +363,7 @@ if __name__ == '__main__':
     )
 
     #? Close Procedure
-    arcpy.AddMessage('Exporting Final Layer')
+    trace.begin('Exporting Final Layer')
 
     # Exportamos los datos
     arcpy.conversion.ExportFeatures(
@@ -369,7 +376,9 @@ if __name__ == '__main__':
 
     # Borramos los datos intermedios
     if tmpBool:
-        arcpy.AddMessage('Keeping Intermediate Data')
+        trace.message('Keeping Intermediate Data')
     else:
-        arcpy.AddMessage('Deleting Intermediate Data')
-        arcpy.management.Delete(fr"'{tmpDataPath}';")
\ No newline at end of file
+        trace.begin('Deleting Intermediate Data')
+        arcpy.management.Delete(fr"'{tmpDataPath}';")
+
+    trace.end()
\ No newline at end of file